@@ -5,6 +5,12 @@ from matplotlib.animation import FFMpegWriter
 from matplotlib import colors
 import matplotlib.pyplot as plt
 import os
+import warnings
+from forces import ForceField, morse_parameters
+from rules import death_mask
+from growth import GrowingDomain
+from checkpoint import load_checkpoint, save_checkpoint
+from counter_rng import CounterRNG
 
 # Constants
 GRID_SIZE = (100, 100)  # Grid size (100x100)
@@ -26,10 +32,24 @@ AMM = 0.5  # Attraction strength for melanophores
 AXX = 0.5  # Attraction strength for xanthophores
 AXM = 0.5  # Attraction strength for melanophore and xanthophore
 
+# Net Morse forces for the whole grid, computed with zero-padded FFTs over the plain distance
+force_field = ForceField(morse_parameters(RMM, RXX, RXM, AMM, AXX, AXM, DMM, DXX, DXM), periodic=False)
+
 GROWTH_FRAMES = 10  # after how many frames the fish grows
+FINAL_SIZE = (GRID_SIZE[0] + 2 * (STEPS // GROWTH_FRAMES), GRID_SIZE[1] + 2 * (STEPS // GROWTH_FRAMES))  # size of the fully grown fish
+
+CHECKPOINT_EVERY = 0  # after how many frames a checkpoint is written (0 for no checkpoints, e.g. 50 to be able to resume)
+CHECKPOINT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'zebrafish_stripe_formation_checkpoint.npz')
+RESUME_FROM = None  # checkpoint file to continue from, or None to start from the initial cells
+SEED = None  # Seed of the random draws (None for a new seed every run)
 
-# Initialize grid with empty cells
-grid = np.zeros(GRID_SIZE, dtype=int)
+# Counter-based random draws, keyed by seed, step and cell (see counter_rng.py)
+random_draws = CounterRNG(SEED)
+
+# Initialize grid with empty cells: the domain is allocated at the final size once,
+# and grid is the part of it the fish currently covers
+domain = GrowingDomain(GRID_SIZE, FINAL_SIZE)
+grid = domain.active
 
 def initialize_cells(grid):
     # Top and bottom rows are melanophores with empty spaces between each cell
@@ -66,25 +86,26 @@ def morse_potential(x1, y1, x2, y2, type1, type2):
 
 # Function to update the grid based on interaction rules
 def update_grid(grid):
+    rows, cols = grid.shape  # Current size of the (growing) fish
     new_grid = grid.copy()
     
+    # Calculate the net force on every cell based on the Morse potential
+    force_x_field, force_y_field = force_field(grid)
+    
+    # Cells with too many cells of the other type nearby die
+    dies = death_mask(grid, 'benthe')
+    
     # Loop through all cells on the grid
-    for x in range(GRID_SIZE[0]):
-        for y in range(GRID_SIZE[1]):
+    for x in range(rows):
+        for y in range(cols):
             if grid[x, y] != EMPTY:
-                # Calculate the net force on each cell based on the Morse potential
-                force_x = 0
-                force_y = 0
-                for i in range(GRID_SIZE[0]):
-                    for j in range(GRID_SIZE[1]):
-                        if (i != x or j != y) and grid[i, j] != EMPTY:
-                            potential = morse_potential(x, y, i, j, grid[x, y], grid[i, j])
-                            force_x += potential * (i - x) / np.sqrt((i - x)**2 + (j - y)**2)
-                            force_y += potential * (j - y) / np.sqrt((i - x)**2 + (j - y)**2)
+                # Net force on this cell from the precomputed force field
+                force_x = force_x_field[x, y]
+                force_y = force_y_field[x, y]
                 
                 # Move the cell based on the calculated forces (scaled for simplicity)
-                new_x = min(max(0, x + int(force_x * 0.1)), GRID_SIZE[0] - 1)
-                new_y = min(max(0, y + int(force_y * 0.1)), GRID_SIZE[1] - 1)
+                new_x = min(max(0, x + int(force_x * 0.1)), rows - 1)
+                new_y = min(max(0, y + int(force_y * 0.1)), cols - 1)
                 
                 # If the cell moves to a new location, update the grid
                 if new_grid[new_x, new_y] == EMPTY:
@@ -92,23 +113,15 @@ def update_grid(grid):
                     new_grid[x, y] = EMPTY
                 
                 # Implement differentiation and death rules here
-                if grid[x, y] == MELANOPHORE:
-                    # Cell death condition for melanophores: too many xanthophores nearby
-                    nearby_xanthophores = np.sum(grid[max(0, x - 1):min(GRID_SIZE[0], x + 2), max(0, y - 1):min(GRID_SIZE[1], y + 2)] == XANTHOPHORE)
-                    if nearby_xanthophores > 3:  # Threshold for melanophore death
-                        new_grid[x, y] = EMPTY
-                
-                elif grid[x, y] == XANTHOPHORE:
-                    # Cell death condition for xanthophores: too many melanophores nearby
-                    nearby_melanophores = np.sum(grid[max(0, x - 1):min(GRID_SIZE[0], x + 2), max(0, y - 1):min(GRID_SIZE[1], y + 2)] == MELANOPHORE)
-                    if nearby_melanophores > 3:  # Threshold for xanthophore death
-                        new_grid[x, y] = EMPTY
+                # Cell death condition: more than 3 cells of the other type nearby
+                if dies[x, y]:
+                    new_grid[x, y] = EMPTY
                 
                 # Differentiation rule: check for empty spaces
                 if grid[x, y] == EMPTY:
                     # Randomly select a nearby region and check for conditions for differentiation
-                    nearby_cells = grid[max(0, x - 1):min(GRID_SIZE[0], x + 2), max(0, y - 1):min(GRID_SIZE[1], y + 2)]
-                    if np.random.rand() < 0.1:  # Probability of differentiation
+                    nearby_cells = grid[max(0, x - 1):min(rows, x + 2), max(0, y - 1):min(cols, y + 2)]
+                    if random_draws.uniform(step_count, 'differentiation', x * cols + y) < 0.1:  # Probability of differentiation
                         if np.sum(nearby_cells == MELANOPHORE) > np.sum(nearby_cells == XANTHOPHORE):  # More melanophores nearby
                             new_grid[x, y] = MELANOPHORE
                         else:
@@ -124,44 +137,57 @@ def plot_grid(grid):
 # Initialize grid with cells based on the new initialization function
 grid = initialize_cells(grid)  # Initialize cells
 
+number_of_frames = 0
+step_count = 0
+
+# Continue from a checkpoint: grid, step counter, growth state and random seed
+if RESUME_FROM is not None:
+    state = load_checkpoint(RESUME_FROM)
+    domain = GrowingDomain(state['grid'].shape, FINAL_SIZE)
+    domain.active[...] = state['grid']
+    grid = domain.active
+    number_of_frames = state['number_of_frames']
+    step_count = state['step']
+    random_draws = CounterRNG(state['seed'])
+    if step_count >= STEPS:
+        raise ValueError(f"Checkpoint {RESUME_FROM} is at step {step_count}, nothing is left of the {STEPS} steps")
+
 # Set up the figure and axis for animation
 fig, ax = plt.subplots(figsize=(6, 6))
 cax = ax.imshow(grid, cmap=colors.ListedColormap(['white', 'black', 'yellow']))
 
-number_of_frames = 0
-
 # Update function for animation
 def update(frame):
     global grid
     global number_of_frames 
+    global step_count
     number_of_frames = number_of_frames + 1
+    step_count = step_count + 1
     
-    # Determine whether to expand the grid
+    # Determine whether to expand the grid (widens the active region of the domain in place)
     if number_of_frames >= GROWTH_FRAMES:
-        new_size = (grid.shape[0] + 2, grid.shape[1] + 2)
-        new_grid = np.zeros(new_size, dtype=int)
-        
-        # Calculate offsets to center the existing grid
-        row_offset = (new_size[0] - grid.shape[0]) // 2
-        col_offset = (new_size[1] - grid.shape[1]) // 2
-        
-        # Place the existing grid in the middle of the new grid
-        new_grid[row_offset:row_offset + grid.shape[0], col_offset:col_offset + grid.shape[1]] = grid
-        
-        # Assign the expanded grid back to `grid`
-        grid = new_grid
+        if not domain.grow():
+            warnings.warn(f"The fish reached FINAL_SIZE {FINAL_SIZE} at step {step_count} and stops growing")
         number_of_frames = 0
     
     # Update the grid using the existing update_grid function
-    grid = update_grid(grid)  # Update grid at each step
+    grid = domain.step(update_grid)  # Update grid at each step
+    
+    # Write a checkpoint every CHECKPOINT_EVERY frames
+    if CHECKPOINT_EVERY and step_count % CHECKPOINT_EVERY == 0:
+        save_checkpoint(CHECKPOINT_FILE, grid, step_count, number_of_frames=number_of_frames, seed=random_draws.seed)
     
     # Update the plot with the new grid size
     cax.set_array(grid)
     cax.set_extent([0, grid.shape[1], 0, grid.shape[0]])  # Update plot extent
     return [cax]
 
-# Create the animation
-ani = animation.FuncAnimation(fig, update, frames=STEPS, interval=200, blit=True)
+# Function to draw the first frame without taking a step
+def init():
+    return [cax]
+
+# Create the animation (a resumed run only takes the steps that are left)
+ani = animation.FuncAnimation(fig, update, frames=STEPS - step_count, init_func=init, interval=200, blit=True)
 
 # Saving the animation
 script_dir = os.path.dirname(os.path.abspath(__file__))  # Get script directory
@@ -1,8 +1,10 @@
 import numpy as np
-import random
 import matplotlib.pyplot as plt
 from matplotlib import colors
 import matplotlib.animation as animation
+import model
+from counter_rng import CounterRNG
+from rules import death_mask, differentiation
 
 # Constants
 GRID_SIZE = (100, 100)  # Grid size (100x100)
@@ -10,66 +12,26 @@ MELANOPHORE = 1  # Black stripe cells (melanophores)
 XANTHOPHORE = 2  # Yellow interstripe cells (xanthophores)
 EMPTY = 0  # Empty cells
 STEPS = 100  # Number of simulation steps
+SEED = None  # Seed of the random draws (None for a new seed every run)
+
+# Counter-based random draws, keyed by seed, step and cell (see counter_rng.py)
+random_draws = CounterRNG(SEED)
 
 # Initialize grid with empty cells
 grid = np.zeros(GRID_SIZE, dtype=int)
 
 # Function to initialize cells (randomly place melanophores and xanthophores)
 def initialize_cells(grid, num_melanophores=200, num_xanthophores=200):
-    for _ in range(num_melanophores):
-        x, y = random.randint(0, GRID_SIZE[0]-1), random.randint(0, GRID_SIZE[1]-1)
-        grid[x, y] = MELANOPHORE
-    for _ in range(num_xanthophores):
-        x, y = random.randint(0, GRID_SIZE[0]-1), random.randint(0, GRID_SIZE[1]-1)
-        grid[x, y] = XANTHOPHORE
-    return grid
-
-# Function to initialize cells (randomly place melanophores and xanthophores)
-def initialize_cells(grid, num_melanophores=200, num_xanthophores=200):
-    for _ in range(num_melanophores):
-        x, y = random.randint(0, GRID_SIZE[0]-1), random.randint(0, GRID_SIZE[1]-1)
-        grid[x, y] = MELANOPHORE
-    for _ in range(num_xanthophores):
-        x, y = random.randint(0, GRID_SIZE[0]-1), random.randint(0, GRID_SIZE[1]-1)
-        grid[x, y] = XANTHOPHORE
-    return grid
-
-# Function to calculate the number of adjacent melanophores and xanthophores
-def count_neighbors(grid, x, y):
-    melanophores = 0
-    xanthophores = 0
-    for i in range(x-1, x+2):
-        for j in range(y-1, y+2):
-            if 0 <= i < GRID_SIZE[0] and 0 <= j < GRID_SIZE[1] and (i != x or j != y):
-                if grid[i, j] == MELANOPHORE:
-                    melanophores += 1
-                elif grid[i, j] == XANTHOPHORE:
-                    xanthophores += 1
-    return melanophores, xanthophores
+    return model.initialize_cells(grid, 'random', random_draws, num_melanophores, num_xanthophores)
 
 # Function to update the grid based on interaction rules
-def update_grid(grid):
+def update_grid(grid, step):
     new_grid = grid.copy()
-    for x in range(GRID_SIZE[0]):
-        for y in range(GRID_SIZE[1]):
-            melanophores, xanthophores = count_neighbors(grid, x, y)
-            
-            if grid[x, y] == MELANOPHORE:
-                # Melanophores repelling xanthophores
-                if xanthophores > melanophores:  # If there are more xanthophores nearby, melanophores may die
-                    new_grid[x, y] = EMPTY
-            elif grid[x, y] == XANTHOPHORE:
-                # Xanthophores repelling melanophores
-                if melanophores > xanthophores:  # If there are more melanophores nearby, xanthophores may die
-                    new_grid[x, y] = EMPTY
-            else:
-                # Empty cell differentiation (may become melanophore or xanthophore)
-                if melanophores > xanthophores:
-                    if random.random() < 0.05:  # Random chance for differentiation into melanophore
-                        new_grid[x, y] = MELANOPHORE
-                elif xanthophores > melanophores:
-                    if random.random() < 0.05:  # Random chance for differentiation into xanthophore
-                        new_grid[x, y] = XANTHOPHORE
+    # Melanophores and xanthophores die if the other type is the majority of their neighbors
+    new_grid[death_mask(grid, 'test')] = EMPTY
+    # Empty cell differentiation (may become melanophore or xanthophore)
+    births = differentiation(grid, 'test', random_draws, step)
+    new_grid[births != EMPTY] = births[births != EMPTY]
     return new_grid
 
 # Function to visualize the grid
@@ -84,10 +46,14 @@ grid = initialize_cells(grid)  # Initialize cells
 fig, ax = plt.subplots(figsize=(6, 6))
 cax = ax.imshow(grid, cmap=colors.ListedColormap(['white', 'black', 'yellow']))
 
+step_count = 0
+
 # Update function for animation
 def update(frame):
     global grid
-    grid = update_grid(grid)  # Update grid at each step
+    global step_count
+    step_count = step_count + 1
+    grid = update_grid(grid, step_count)  # Update grid at each step
     cax.set_array(grid)  # Update the grid visualization
     return [cax]
 
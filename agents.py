@@ -0,0 +1,154 @@
+import itertools
+
+import numpy as np
+
+from forces import CELL_TYPES, EMPTY, ForceField
+
+# Sparse alternative to forces.ForceField: the cells are kept as packed arrays
+# (x, y, type), binned in a cell list with bins at least one cutoff wide, and the
+# Morse force is only evaluated for pairs within the cutoff radius. The cost grows
+# with the number of cells and the local density instead of the grid area squared,
+# which pays off for sparse grids on large domains, where the cutoff is much smaller
+# than the grid.
+
+# Function to get the occupied cells of a grid as packed arrays (struct of arrays)
+def cell_arrays(grid):
+    x, y = np.nonzero(grid != EMPTY)
+    return x, y, grid[x, y]
+
+
+# Net Morse force on every cell, only counting pairs closer than the cutoff.
+# Like forces.ForceField the potential uses the (wrapped) distance and the direction
+# the plain offset, so with a cutoff beyond the largest distance on the grid the
+# result is the same as the full sum. The default cutoff is three times the largest
+# length scale; with the length scales of main.py (82 cells) that covers the whole torus
+# up to about 350 x 350, and whenever the cutoff covers the grid there is nothing to
+# prune, so the dense forces.ForceField is used instead. Otherwise the pairs are built
+# and summed for bounded chunks of cells (at most max_pairs pairs at a time), so memory
+# does not grow with the square of the number of cells.
+class SparseForceField:
+    def __init__(self, params, periodic=True, cutoff=None, max_pairs=1 << 20):
+        self.params = params  # Output of forces.morse_parameters
+        self.periodic = periodic
+        if cutoff is None:
+            # The Morse terms are negligible beyond a few length scales
+            cutoff = 3 * max(max(r, a) for R, A, r, a in params.values())
+        self.cutoff = cutoff
+        self.max_pairs = max_pairs
+        self._dense = ForceField(params, periodic)  # Used when the cutoff covers the grid
+
+        # Parameter tables indexed by [type of the cell, type of the other cell]
+        size = max(CELL_TYPES) + 1
+        self._tables = [np.zeros((size, size)) for _ in range(4)]
+        for (type1, type2), values in params.items():
+            for table, value in zip(self._tables, values):
+                table[type1, type2] = value
+
+    # Function to check whether the cutoff covers every distance on a grid of this shape
+    def covers(self, shape):
+        if self.periodic:
+            return self.cutoff >= np.hypot(shape[0] // 2, shape[1] // 2)
+        return self.cutoff >= np.hypot(shape[0] - 1, shape[1] - 1)
+
+    # Function to build the cell list: the cells sorted by bin, the range of every bin in that
+    # order, and for every cell the neighbouring bins (one column per bin offset, -1 outside
+    # the grid)
+    def _cell_list(self, x, y, shape):
+        bins = [max(1, int(size // self.cutoff)) for size in shape]  # Bins per axis, each at least cutoff wide
+        bin_x = x * bins[0] // shape[0]
+        bin_y = y * bins[1] // shape[1]
+
+        # Sort the cells by bin so every bin is a contiguous range
+        bin_id = bin_x * bins[1] + bin_y
+        order = np.argsort(bin_id, kind='stable')
+        starts = np.searchsorted(bin_id[order], np.arange(bins[0] * bins[1]), side='left')
+        ends = np.searchsorted(bin_id[order], np.arange(bins[0] * bins[1]), side='right')
+
+        # Neighbouring bin offsets; with wrapping, fewer than 3 bins would visit the same bin twice
+        offsets = set()
+        for i, j in itertools.product((-1, 0, 1), repeat=2):
+            if self.periodic:
+                offsets.add((i % bins[0], j % bins[1]))
+            else:
+                offsets.add((i, j))
+
+        neighbours = []
+        for i, j in offsets:
+            other_x = bin_x + i
+            other_y = bin_y + j
+            if self.periodic:
+                other = (other_x % bins[0]) * bins[1] + other_y % bins[1]
+            else:
+                inside = (other_x >= 0) & (other_x < bins[0]) & (other_y >= 0) & (other_y < bins[1])
+                other = np.where(inside, other_x * bins[1] + other_y, -1)
+            neighbours.append(other)
+        return order, starts, ends, np.stack(neighbours, axis=1)
+
+    # Function to find the pairs (i, j) of the given cells (all cells by default) with every
+    # cell in their neighbouring bins
+    def pairs(self, x, y, shape, cells=None, cell_list=None):
+        order, starts, ends, neighbours = cell_list or self._cell_list(x, y, shape)
+        if cells is None:
+            cells = np.arange(x.size)
+
+        first, second = [], []
+        for column in range(neighbours.shape[1]):
+            other = neighbours[cells, column]
+            inside = other >= 0
+            cell, other = cells[inside], other[inside]
+            counts = ends[other] - starts[other]
+
+            # Every cell against every cell of the neighbouring bin
+            position = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            first.append(np.repeat(cell, counts))
+            second.append(order[np.repeat(starts[other], counts) + position])
+
+        first = np.concatenate(first) if first else np.zeros(0, dtype=int)
+        second = np.concatenate(second) if second else np.zeros(0, dtype=int)
+        keep = first != second
+        return first[keep], second[keep]
+
+    # Function to calculate force_x and force_y for every cell (zero on empty positions)
+    def __call__(self, grid):
+        if self.covers(grid.shape):
+            return self._dense(grid)
+
+        x, y, types = cell_arrays(grid)
+        cell_list = self._cell_list(x, y, grid.shape)
+        order, starts, ends, neighbours = cell_list
+
+        # Split the cells into chunks of at most max_pairs candidate pairs (a cell with more
+        # pairs than that gets a chunk of its own)
+        pair_counts = np.where(neighbours >= 0, (ends - starts)[neighbours], 0).sum(axis=1)
+        total = np.cumsum(pair_counts)
+        bounds = np.searchsorted(total, np.arange(1, total[-1] // self.max_pairs + 1) * self.max_pairs, side='right') \
+            if x.size else np.zeros(0, dtype=int)
+        bounds = np.unique(np.concatenate([[0], np.maximum(bounds, 1), [x.size]]))
+
+        force_x = np.zeros(grid.shape)
+        force_y = np.zeros(grid.shape)
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            cells = np.arange(start, end)
+            first, second = self.pairs(x, y, grid.shape, cells, cell_list)
+
+            di = x[second] - x[first]
+            dj = y[second] - y[first]
+            if self.periodic:
+                dx = np.minimum(np.abs(di), grid.shape[0] - np.abs(di))
+                dy = np.minimum(np.abs(dj), grid.shape[1] - np.abs(dj))
+            else:
+                dx, dy = di, dj
+            distance = np.sqrt(dx ** 2 + dy ** 2)
+
+            # Only pairs inside the cutoff radius interact
+            close = distance <= self.cutoff
+            first, second, di, dj, distance = first[close], second[close], di[close], dj[close], distance[close]
+
+            R, A, r, a = (table[types[first], types[second]] for table in self._tables)
+            potential = np.where(distance == 0, 0.0, R * np.exp(-distance / r) - A * np.exp(-distance / a))
+            norm = np.sqrt(di ** 2 + dj ** 2)
+
+            # Every cell of the chunk gets all of its pairs here, so the sums are complete
+            force_x[x[cells], y[cells]] = np.bincount(first - start, potential * di / norm, minlength=cells.size)
+            force_y[x[cells], y[cells]] = np.bincount(first - start, potential * dj / norm, minlength=cells.size)
+        return force_x, force_y
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import warnings
+from importlib import metadata
+
+import numpy as np
+
+from forces import EMPTY
+
+# Backends for the sequential part of update_grid: committing deaths, moves and new
+# cells in raster order, where a cell only moves if its target is still empty in the
+# new grid. Every backend gets the same inputs (old grid, death mask, new cells and
+# move targets, all computed with NumPy) and must return the same new grid.
+#   'numpy' - reference loop in Python over the occupied cells and new cells
+#   'numba' - the same loop compiled with Numba, if Numba is installed
+
+# Function to commit deaths, moves and new cells in raster order (reference version).
+# If counts is given (an int64 array of length 2), the number of moved and blocked cells
+# is added to it.
+def commit_numpy(grid, dies, births, target_x, target_y, counts=None):
+    new_grid = grid.copy()
+    for x, y in zip(*np.nonzero((grid != EMPTY) | (births != EMPTY))):
+        if grid[x, y] != EMPTY:
+            if dies[x, y]:
+                new_grid[x, y] = EMPTY
+
+            # Only move cells if they are not dead, and only to an empty position
+            if new_grid[x, y] != EMPTY:
+                new_x, new_y = target_x[x, y], target_y[x, y]
+                if new_grid[new_x, new_y] == EMPTY:
+                    new_grid[new_x, new_y] = grid[x, y]
+                    new_grid[x, y] = EMPTY
+                    if counts is not None:
+                        counts[0] += 1
+                elif counts is not None and (new_x != x or new_y != y):
+                    counts[1] += 1
+
+        # Differentiation rule: the empty cell becomes the majority type around it
+        else:
+            new_grid[x, y] = births[x, y]
+    return new_grid
+
+
+# Function to build the compiled backend. Numba is only imported here, the first time the
+# backend is asked for, so processes that never use it do not pay for importing it.
+def _load_numba():
+    try:
+        import numba
+    except ImportError:
+        return None
+
+    # Same loop as commit_numpy, compiled
+    @numba.njit(cache=True)
+    def commit_numba(grid, dies, births, target_x, target_y, counts=None):
+        new_grid = grid.copy()
+        rows, cols = grid.shape
+        for x in range(rows):
+            for y in range(cols):
+                if grid[x, y] != EMPTY:
+                    if dies[x, y]:
+                        new_grid[x, y] = EMPTY
+                    if new_grid[x, y] != EMPTY:
+                        new_x = target_x[x, y]
+                        new_y = target_y[x, y]
+                        if new_grid[new_x, new_y] == EMPTY:
+                            new_grid[new_x, new_y] = grid[x, y]
+                            new_grid[x, y] = EMPTY
+                            if counts is not None:
+                                counts[0] += 1
+                        elif counts is not None and (new_x != x or new_y != y):
+                            counts[1] += 1
+                elif births[x, y] != EMPTY:
+                    new_grid[x, y] = births[x, y]
+        return new_grid
+
+    return commit_numba
+
+
+# Backends by name, with the function that builds each one (None if it cannot be built)
+BACKEND_LOADERS = {'numpy': lambda: commit_numpy, 'numba': _load_numba}
+_loaded = {}
+
+# Function to build one backend (None if it cannot be built here)
+def load_backend(name):
+    if name not in _loaded:
+        _loaded[name] = BACKEND_LOADERS[name]()
+    return _loaded[name]
+
+# Function to get the backends that can be used here, by name
+def available_backends():
+    backends = {name: load_backend(name) for name in BACKEND_LOADERS}
+    return {name: commit for name, commit in backends.items() if commit is not None}
+
+# Result of the startup check, filled in by verify_backends. It is also kept on disk next to
+# Numba's compiled cache, so the check runs once per install instead of once per process.
+_verified = None
+VERIFY_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '__pycache__', 'backends_verified.json')
+
+# Function to get what the startup check depends on: this file and the NumPy and Numba versions
+def _verify_key():
+    with open(os.path.abspath(__file__), 'rb') as file:
+        source = hashlib.sha256(file.read()).hexdigest()
+    versions = {}
+    for package in ('numpy', 'numba'):
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    return dict(versions, source=source)
+
+# Function to get the result of the startup check, from the cache on disk if it is still valid
+def _cached_verification():
+    key = _verify_key()
+    try:
+        with open(VERIFY_CACHE) as file:
+            cached = json.load(file)
+        if cached['key'] == key:
+            return cached['results']
+    except (OSError, ValueError, KeyError):
+        pass
+    results = verify_backends()
+    try:
+        os.makedirs(os.path.dirname(VERIFY_CACHE), exist_ok=True)
+        temporary = f'{VERIFY_CACHE}.{os.getpid()}.tmp'
+        with open(temporary, 'w') as file:
+            json.dump({'key': key, 'results': results}, file)
+        os.replace(temporary, VERIFY_CACHE)
+    except OSError:
+        pass  # Read-only install: check again next time
+    return results
+
+# Function to check that every available backend gives the same grids as the reference
+# for a fixed seed. Returns a dict with True or False per backend.
+def verify_backends(grid_size=(24, 24), steps=3, seed=0):
+    import model
+
+    results = {}
+    reference = None
+    for name in available_backends():
+        simulation = model.Simulation(grid_size, RMM=2.0, RXM=1.0, initial='random', seed=seed, backend=name)
+        grids = [simulation.step().copy() for _ in range(steps)]
+        if reference is None:
+            reference = grids
+        results[name] = all(np.array_equal(grid, expected) for grid, expected in zip(grids, reference))
+    return results
+
+# Function to get the commit function of a backend. 'auto' picks the compiled backend if it
+# is available and passes the startup check, and falls back to the NumPy reference otherwise.
+# 'auto' imports Numba, so it is opt-in; the simulations default to 'numpy' so headless
+# workers start quickly.
+def select_backend(name='auto'):
+    global _verified
+    if name != 'auto':
+        commit = load_backend(name) if name in BACKEND_LOADERS else None
+        if commit is None:
+            raise ValueError(f"Backend {name!r} is not available, available backends are {list(available_backends())}")
+        return commit
+
+    if _verified is None:
+        _verified = _cached_verification()
+        for backend, identical in _verified.items():
+            if not identical:
+                warnings.warn(f"Backend {backend!r} does not give the same grids as the reference, it will not be used")
+    for backend in ('numba', 'numpy'):
+        if _verified.get(backend):
+            return available_backends()[backend]
+    return commit_numpy
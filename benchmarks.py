@@ -0,0 +1,285 @@
+import argparse
+import csv
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+import model
+from backends import available_backends
+from forces import EMPTY, MELANOPHORE, XANTHOPHORE
+from tiled import TiledSimulation
+
+# Scaling benchmarks for update_grid: every engine is timed for one step and for an
+# N-step run over a matrix of grid sizes, cell densities and initial layouts. Every
+# engine's final grid is compared with the reference for the same seed, so a faster engine
+# cannot quietly change the results. On small grids the reference is the original
+# per-cell update_grid loop of main.py, so the FFT forces and vectorized rules are
+# checked too; on larger grids, where that loop is too slow, it is the FFT forces with
+# the NumPy commit backend.
+# Results go to JSON and CSV, and can be checked against an earlier run for regressions.
+
+SIZES = (25, 50, 100, 200, 500, 1000)
+DENSITIES = (0.02, 0.1, 0.3)  # Fraction of the grid covered by cells in the random layout
+LAYOUTS = ('stripes', 'random')
+STEPS = 5
+SEED = 0
+REFERENCE = 'fft-numpy'
+ORIGINAL = 'original'  # The per-cell loop of main.py
+ORIGINAL_MAX_SIZE = 50  # Largest grid size the original loop is run (and used as reference) for
+SPARSE_MAX_PAIRS = 5e7  # Largest number of cell pairs the sparse engines are run for
+
+# Strengths with visible movement, so the commit phase does real work
+PARAMS = dict(RMM=3.0, RXX=1.0, RXM=2.0, AMM=0.5, AXX=0.5, AXM=0.5)
+
+# Function to set up a simulation for one benchmark point
+def make_simulation(size, density, layout, engine='fft', backend='numpy', incremental=False, moves='raster'):
+    simulation = model.Simulation((size, size), **PARAMS, initial=layout, seed=SEED, engine=engine, backend=backend,
+                                  grid=np.zeros((size, size), dtype=int), incremental=incremental, moves=moves)
+    cells = int(density * size * size / 2)
+    model.initialize_cells(simulation.grid, layout, simulation.rng, num_melanophores=cells, num_xanthophores=cells)
+    return simulation
+
+# Function to update the grid the way update_grid in main.py did before it was vectorized:
+# every cell in raster order, the Morse force summed over all other cells one pair at a
+# time, and one draw from random_source per empty cell with a majority type around it.
+# Only the cells that are not empty are visited in the force sum, which skips nothing
+# (empty cells add no force) but keeps it usable on 50 x 50 grids.
+def original_update_grid(grid, params, random_source):
+    rows, cols = grid.shape
+    new_grid = grid.copy()
+    occupied = list(zip(*np.nonzero(grid != EMPTY)))
+
+    # Morse potential between two cells over the wrapped distance
+    def morse_potential(x1, y1, x2, y2, type1, type2):
+        dx = min(abs(x2 - x1), rows - abs(x2 - x1))
+        dy = min(abs(y2 - y1), cols - abs(y2 - y1))
+        distance = np.sqrt(dx ** 2 + dy ** 2)
+        if distance == 0:
+            return 0
+        if type1 == MELANOPHORE and type2 == MELANOPHORE:
+            R, A, r, a = params['RMM'], params['AMM'], params['DMM'], params['DMM']
+        elif type1 == XANTHOPHORE and type2 == XANTHOPHORE:
+            R, A, r, a = params['RXX'], params['AXX'], params['DXX'], params['DXX']
+        else:
+            R, A, r, a = params['RXM'], params['AXM'], params['DXM'], params['DXM']
+        return R * np.exp(-distance / r) - A * np.exp(-distance / a)
+
+    for x in range(rows):
+        for y in range(cols):
+            if grid[x, y] != EMPTY:
+                # Death: more than 4 cells of the other type in the direct_neighbors slice
+                other = XANTHOPHORE if grid[x, y] == MELANOPHORE else MELANOPHORE
+                direct_neighbors = grid[max(0, x - 1):min(rows, x + 2), max(0, y - 1):min(cols, y + 2)]
+                if np.sum(direct_neighbors == other) - (direct_neighbors[1, 1] == other) > 4:
+                    new_grid[x, y] = EMPTY
+
+                # Only move cells if they are not dead, and only to an empty position
+                if new_grid[x, y] != EMPTY:
+                    force_x = 0
+                    force_y = 0
+                    for i, j in occupied:
+                        if i != x or j != y:
+                            potential = morse_potential(x, y, i, j, grid[x, y], grid[i, j])
+                            force_x += potential * (i - x) / np.sqrt((i - x) ** 2 + (j - y) ** 2)
+                            force_y += potential * (j - y) / np.sqrt((i - x) ** 2 + (j - y) ** 2)
+                    new_x = min(max(0, x + int(force_x * 0.1)), rows - 1)
+                    new_y = min(max(0, y + int(force_y * 0.1)), cols - 1)
+                    if new_grid[new_x, new_y] == EMPTY:
+                        new_grid[new_x, new_y] = grid[x, y]
+                        new_grid[x, y] = EMPTY
+
+            # Differentiation: wrapped 8-neighbour majority, 5% chance
+            if grid[x, y] == EMPTY:
+                melanophores = xanthophores = 0
+                for i in range(x - 1, x + 2):
+                    for j in range(y - 1, y + 2):
+                        if (i % rows, j % cols) != (x, y):
+                            melanophores += grid[i % rows, j % cols] == MELANOPHORE
+                            xanthophores += grid[i % rows, j % cols] == XANTHOPHORE
+                if melanophores > xanthophores:
+                    if random_source() < 0.05:
+                        new_grid[x, y] = MELANOPHORE
+                elif xanthophores > melanophores:
+                    if random_source() < 0.05:
+                        new_grid[x, y] = XANTHOPHORE
+    return new_grid
+
+
+# Steps a model.Simulation with original_update_grid instead of model.update_grid
+class OriginalLoop:
+    def __init__(self, simulation):
+        self.simulation = simulation
+
+    def step(self):
+        simulation = self.simulation
+        simulation.grid = original_update_grid(simulation.grid, simulation.params, simulation.rng.random)
+        simulation.step_count += 1
+        return simulation.grid
+
+
+# Engines by name: function that gives (object with a step method, function to clean up)
+def _engines():
+    engines = {ORIGINAL: lambda size, density, layout: (OriginalLoop(make_simulation(size, density, layout)), None)}
+    for backend in available_backends():
+        for force_engine in model.FORCE_ENGINES:
+            engines[f'{force_engine}-{backend}'] = (
+                lambda size, density, layout, f=force_engine, b=backend: (make_simulation(size, density, layout, f, b), None)
+            )
+
+    # Local rules only re-evaluated around changed cells (see incremental.py)
+    engines['fft-numpy-incremental'] = lambda size, density, layout: (
+        make_simulation(size, density, layout, 'fft', 'numpy', incremental=True), None
+    )
+
+    # All moves committed at once, collisions resolved by force magnitude (see moves.py)
+    engines['fft-batched'] = lambda size, density, layout: (
+        make_simulation(size, density, layout, 'fft', 'numpy', moves='force'), None
+    )
+
+    # Tiled stepping with the fastest available commit backend
+    def tiled(size, density, layout):
+        backend = 'numba' if 'numba' in available_backends() else 'numpy'
+        runner = TiledSimulation(make_simulation(size, density, layout, 'fft', backend))
+        return runner, runner.close
+    engines['tiled'] = tiled
+    return engines
+
+# Function to check whether an engine should match the reference exactly. The batched
+# move commit resolves collisions by priority instead of raster order, so it never is.
+# The sparse engines drop pairs beyond their cutoff (by default three times the largest
+# length scale), so they are only exact while the cutoff covers the largest wrapped distance.
+def is_exact(engine, size):
+    if engine == ORIGINAL:
+        return True
+    if engine == 'fft-batched':
+        return False
+    if not engine.startswith('sparse'):
+        return True
+    return 3 * max(model.DMM, model.DXX, model.DXM) >= np.hypot(size // 2, size // 2)
+
+# Function to check whether an engine is run at a benchmark point: the original loop only on
+# small grids, and the sparse engines only while the number of cell pairs is manageable (or
+# their cutoff covers the grid, so they use the FFT forces)
+def is_feasible(engine, size, cells):
+    if engine == ORIGINAL:
+        return size <= ORIGINAL_MAX_SIZE
+    if engine.startswith('sparse') and not is_exact(engine, size):
+        return cells ** 2 <= SPARSE_MAX_PAIRS
+    return True
+
+# Function to time one engine at one benchmark point
+def run_engine(factory, size, density, layout, steps):
+    stepper, close = factory(size, density, layout)
+    try:
+        start = time.perf_counter()
+        grid = stepper.step()
+        first_step = time.perf_counter() - start  # Includes setup such as kernel spectra and JIT compilation
+
+        step_times = []
+        for _ in range(steps - 1):
+            start = time.perf_counter()
+            grid = stepper.step()
+            step_times.append(time.perf_counter() - start)
+        grid = np.array(grid)
+    finally:
+        if close is not None:
+            close()
+    return {
+        'first_step_seconds': first_step,
+        'step_seconds': statistics.median(step_times) if step_times else first_step,
+        'run_seconds': first_step + sum(step_times),
+    }, grid
+
+# Function to make the list of benchmark points. The stripe layout has a fixed density and
+# needs at least model.STRIPES_MIN_ROWS rows.
+def benchmark_points(sizes=SIZES, densities=DENSITIES, layouts=LAYOUTS):
+    points = []
+    for size in sizes:
+        for layout in layouts:
+            if layout == 'stripes' and size < model.STRIPES_MIN_ROWS:
+                continue
+            for density in (densities if layout == 'random' else (None,)):
+                points.append((size, density, layout))
+    return points
+
+# Function to run all benchmarks and return one record per (point, engine)
+def run_benchmarks(points, engines=None, steps=STEPS):
+    factories = _engines()
+    engines = engines or list(factories)
+    records = []
+    for size, density, layout in points:
+        cells = int(np.count_nonzero(make_simulation(size, density or 0, layout).grid))
+        reference = ORIGINAL if size <= ORIGINAL_MAX_SIZE else REFERENCE
+        reference_timing, reference_grid = run_engine(factories[reference], size, density or 0, layout, steps)
+        for engine in engines:
+            if engine == reference:
+                timing, grid = reference_timing, reference_grid
+            elif not is_feasible(engine, size, cells):
+                print(f"{engine:>14} {size:>5}^2 {layout:>8} density={density}: skipped")
+                continue
+            else:
+                timing, grid = run_engine(factories[engine], size, density or 0, layout, steps)
+            record = dict(engine=engine, size=size, density=density, layout=layout, steps=steps, reference=reference,
+                          cells=int(np.sum(grid != 0)))
+            record.update(timing)
+            record['exact'] = bool(is_exact(engine, size))
+            record['equivalent'] = bool(np.array_equal(grid, reference_grid))
+            record['mismatched_cells'] = int(np.sum(grid != reference_grid))
+            records.append(record)
+            print(f"{engine:>14} {size:>5}^2 {layout:>8} density={density}: {record['step_seconds'] * 1000:9.2f} ms/step "
+                  f"{'ok' if record['equivalent'] else 'DIFFERS' if record['exact'] else 'approximate'}")
+    return records
+
+# Function to write the records as JSON and CSV
+def write_results(records, json_path, csv_path=None):
+    with open(json_path, 'w') as file:
+        json.dump(records, file, indent=2)
+    if csv_path and records:
+        with open(csv_path, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=list(records[0]))
+            writer.writeheader()
+            writer.writerows(records)
+
+# Function to compare records with an earlier run. A record fails if it should be exact but
+# is not equivalent to the reference, or if its time per step grew by more than the tolerance.
+def find_regressions(records, baseline, tolerance=0.25):
+    key = lambda record: (record['engine'], record['size'], record['density'], record['layout'])
+    previous = {key(record): record for record in baseline}
+    problems = []
+    for record in records:
+        if record['exact'] and not record['equivalent']:
+            problems.append(f"{key(record)}: final grid differs from {record['reference']} in {record['mismatched_cells']} cells")
+        old = previous.get(key(record))
+        if old is not None and record['step_seconds'] > old['step_seconds'] * (1 + tolerance):
+            problems.append(f"{key(record)}: {record['step_seconds']:.4f} s/step, was {old['step_seconds']:.4f} s/step")
+    return problems
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark update_grid across grid sizes, densities, layouts and engines.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help="Grid sizes (square grids)")
+    parser.add_argument('--densities', type=float, nargs='+', default=DENSITIES, help="Cell densities for the random layout")
+    parser.add_argument('--layouts', nargs='+', default=LAYOUTS, choices=model.INITIAL_CONDITIONS, help="Initial layouts")
+    parser.add_argument('--engines', nargs='+', default=None, help=f"Engines to run (default: all available: {', '.join(_engines())})")
+    parser.add_argument('--steps', type=int, default=STEPS, help="Steps per run")
+    parser.add_argument('--output', default='benchmark_results.json', help="JSON file for the results")
+    parser.add_argument('--csv', default=None, help="Optional CSV file for the results")
+    parser.add_argument('--baseline', default=None, help="Earlier JSON results to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed slowdown per step against the baseline")
+    args = parser.parse_args()
+
+    records = run_benchmarks(benchmark_points(args.sizes, args.densities, args.layouts), args.engines, args.steps)
+    write_results(records, args.output, args.csv)
+
+    baseline = []
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    problems = find_regressions(records, baseline, args.tolerance)
+    for problem in problems:
+        print(f"REGRESSION {problem}")
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,49 @@
+import json
+import os
+
+import numpy as np
+
+# Checkpoints of a running simulation: the grid (as uint8), the step counter, the full
+# state of the random generators and any extra state (for example the growth state of
+# Test Benthe.py), in one .npz file. The file is written under a temporary name and then
+# renamed, so a crash while writing never leaves a broken checkpoint behind.
+
+# Function to write a checkpoint.
+#   rng_state:       random.Random.getstate() (or random.getstate())
+#   numpy_rng_state: np.random.get_state()
+#   extra:           anything JSON can store
+def save_checkpoint(path, grid, step, rng_state=None, numpy_rng_state=None, **extra):
+    state = dict(extra, step=int(step), grid_dtype=str(grid.dtype))
+    arrays = {'grid': np.asarray(grid).astype(np.uint8)}
+    if rng_state is not None:
+        version, internal, gauss_next = rng_state
+        state['rng'] = [version, gauss_next]
+        arrays['rng_internal'] = np.array(internal, dtype=np.uint64)
+    if numpy_rng_state is not None:
+        name, keys, position, has_gauss, cached_gaussian = numpy_rng_state
+        state['numpy_rng'] = [name, int(position), int(has_gauss), float(cached_gaussian)]
+        arrays['numpy_rng_keys'] = np.asarray(keys)
+    arrays['state'] = np.array(json.dumps(state))
+
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as file:
+        np.savez(file, **arrays)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+# Function to read a checkpoint. Returns a dict with the grid (in its original dtype),
+# step, rng_state and numpy_rng_state (None if not saved) and the extra state.
+def load_checkpoint(path):
+    with np.load(path) as data:
+        state = json.loads(str(data['state']))
+        state['grid'] = data['grid'].astype(state.pop('grid_dtype'))
+        state['rng_state'] = None
+        if 'rng' in state:
+            version, gauss_next = state.pop('rng')
+            state['rng_state'] = (version, tuple(int(value) for value in data['rng_internal']), gauss_next)
+        state['numpy_rng_state'] = None
+        if 'numpy_rng' in state:
+            name, position, has_gauss, cached_gaussian = state.pop('numpy_rng')
+            state['numpy_rng_state'] = (name, data['numpy_rng_keys'].copy(), position, has_gauss, cached_gaussian)
+    return state
@@ -0,0 +1,72 @@
+import secrets
+
+import numpy as np
+
+# Counter-based random draws. Every draw is a pure function of (seed, step, cell, purpose):
+# the key is hashed with the SplitMix64 mixing function, so a whole grid of uniforms
+# comes from one vectorized call, and the draw for a cell does not depend on the order
+# in which cells are visited. A grid therefore gets the same draws whether it is run
+# serially, vectorized, split over strips (tiled.py) or stacked with other replicas
+# (ensemble.py), and those engines can be checked against each other bit for bit.
+
+# What a draw is used for, so different rules never share draws
+PURPOSES = {'initial': 1, 'differentiation': 2, 'moves': 3}
+
+GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+MASK = (1 << 64) - 1
+
+# Function to scramble 64-bit integers (the SplitMix64 finalizer)
+def _mix(x):
+    with np.errstate(over='ignore'):
+        x = np.asarray(x, dtype=np.uint64)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return x ^ (x >> np.uint64(31))
+
+
+# The seed can also be a list of seeds, one per replica of a (replicas, rows, cols) stack:
+# the draws for replica k are then the same as those of CounterRNG(seeds[k]), and a whole
+# stack is drawn in one call.
+class CounterRNG:
+    def __init__(self, seed=None):
+        if seed is None:
+            seed = secrets.randbits(63)  # Fresh seed, kept so the run can be repeated
+        self.seed = seed
+
+    # Function to get the key of one (step, purpose) pair (one key per replica for a list of seeds)
+    def _key(self, step, purpose):
+        if step is None:
+            raise ValueError("Counter-based draws need the step number")
+        if purpose not in PURPOSES:
+            raise ValueError(f"Unknown purpose {purpose!r}, expected one of {tuple(PURPOSES)}")
+        seeds = np.array([int(seed) & MASK for seed in np.ravel(self.seed)], dtype=np.uint64)
+        key = _mix(seeds.reshape(np.shape(self.seed)))
+        key = _mix(key ^ np.uint64(step & MASK))
+        return _mix(key ^ np.uint64(PURPOSES[purpose]))
+
+    # Function to get uniform draws in [0, 1) for the given cells (flat indices in the grid,
+    # or any other counters such as the index of a placement). With a list of seeds, replicas
+    # gives the replica of every cell; without it every replica gets a block of draws
+    # (result shape (replicas,) + cells.shape).
+    def uniform(self, step, purpose, cells, replicas=None):
+        key = self._key(step, purpose)
+        if replicas is not None:
+            key = key[replicas]
+        elif key.ndim:
+            key = key.reshape(key.shape + (1,) * np.ndim(cells))
+        with np.errstate(over='ignore'):
+            bits = _mix(key + (np.asarray(cells, dtype=np.uint64) + np.uint64(1)) * GOLDEN)
+        return (bits >> np.uint64(11)) * (1.0 / (1 << 53))
+
+    # Function to get the uniform draws of rows first_row to last_row of a grid of the given
+    # shape in one block (the whole grid by default). Only the last two axes of shape are the
+    # grid; with a list of seeds the block gets a leading replica axis.
+    def block(self, step, purpose, shape, first_row=0, last_row=None):
+        rows, cols = shape[-2:]
+        last_row = rows if last_row is None else last_row
+        cells = np.arange(first_row * cols, last_row * cols).reshape(last_row - first_row, cols)
+        return self.uniform(step, purpose, cells)
+
+    # Function to get integers from 0 up to (not including) high for the given counters
+    def integers(self, step, purpose, cells, high):
+        return np.floor(self.uniform(step, purpose, cells) * high).astype(np.int64)
@@ -0,0 +1,91 @@
+import random
+
+import numpy as np
+
+import model
+from agents import SparseForceField
+from backends import select_backend
+from counter_rng import CounterRNG
+from moves import MOVE_POLICIES, commit_batched, move_priority
+from rules import death_mask, differentiation_majority, draw_births
+
+# Ensemble of replicas of the main.py model that only differ in their random seed,
+# stepped together as one (replicas, rows, cols) array: the force fields, neighbour
+# counts, death masks and move targets of all replicas come from one batched NumPy
+# operation per step, so the per-step overhead is paid once for the whole ensemble.
+# Every replica has its own random.Random stream (or counter_rng.CounterRNG with
+# draws='counter'), seeded like model.Simulation, so replica k gives exactly the same
+# grids as Simulation(seed=seeds[k], draws=draws, moves=moves).
+# With counter-based draws the differentiation draws of all replicas come from one call
+# over the whole stack, and with a batched move policy ('force' or 'random', see
+# moves.py) all replicas are committed in one call too. Only the random.Random streams
+# and the raster-order commit ('raster') are sequential and run replica by replica.
+class Ensemble:
+    def __init__(self, seeds, grid_size=(50, 50), RMM=0.001, RXX=0.001, RXM=0.001, AMM=0.001, AXX=0.001, AXM=0.001,
+                 DMM=model.DMM, DXX=model.DXX, DXM=model.DXM, initial='stripes', engine='fft', backend='numpy',
+                 draws='stream', moves='raster'):
+        self.seeds = list(seeds)
+        self.params = dict(RMM=RMM, RXX=RXX, RXM=RXM, AMM=AMM, AXX=AXX, AXM=AXM, DMM=DMM, DXX=DXX, DXM=DXM)
+        self.initial = initial
+        if draws not in model.DRAWS:
+            raise ValueError(f"Unknown draws {draws!r}, expected one of {model.DRAWS}")
+        self.draws = draws
+        if moves not in MOVE_POLICIES:
+            raise ValueError(f"Unknown move policy {moves!r}, expected one of {MOVE_POLICIES}")
+        if moves == 'random' and draws != 'counter':
+            raise ValueError("The 'random' move policy needs counter-based draws (draws='counter')")
+        self.moves = moves
+        # One random generator per replica, and for counter-based draws one keyed by all seeds
+        self.rngs = [random.Random(seed) if draws == 'stream' else CounterRNG(seed) for seed in self.seeds]
+        self.counter = CounterRNG([rng.seed for rng in self.rngs]) if draws == 'counter' else None
+        self.force_field = model.make_force_field(**self.params, engine=engine)
+        self.commit = select_backend(backend)
+        self.step_count = 0
+
+        self.grids = np.zeros((len(self.seeds),) + tuple(grid_size), dtype=int)
+        for grid, rng in zip(self.grids, self.rngs):
+            model.initialize_cells(grid, initial, rng)
+
+    # Function to advance all replicas by one step
+    def step(self):
+        grids = self.grids
+
+        # Forces, death masks, differentiation candidates and move targets for all replicas at once
+        if isinstance(self.force_field, SparseForceField):
+            forces = [self.force_field(grid) for grid in grids]  # The cell list works per grid
+            force_x = np.stack([force[0] for force in forces])
+            force_y = np.stack([force[1] for force in forces])
+        else:
+            force_x, force_y = self.force_field(grids)
+        dies = death_mask(grids, 'main')
+        majority = differentiation_majority(grids, 'main')
+        target_x, target_y = model.move_targets(force_x, force_y, grids.shape)
+
+        # Differentiation draws: one call for the stack, or every replica's own stream in turn
+        step = self.step_count + 1
+        if self.counter is not None:
+            births = draw_births(majority, 'main', self.counter, step=step)
+        else:
+            births = np.stack([draw_births(majority[k], 'main', rng.random) for k, rng in enumerate(self.rngs)])
+
+        # Deaths, moves and new cells: all replicas at once, or replica by replica in raster order
+        if self.moves != 'raster':
+            priority = move_priority(self.moves, force_x, force_y, self.counter, step)
+            new_grids = commit_batched(grids, dies, births, target_x, target_y, priority=priority)
+        else:
+            new_grids = np.empty_like(grids)
+            for k in range(len(grids)):
+                new_grids[k] = self.commit(grids[k], dies[k], births[k], target_x[k], target_y[k])
+        self.grids = new_grids
+        self.step_count += 1
+        return self.grids
+
+    # Function to advance all replicas by n steps
+    def run(self, n):
+        for _ in range(n):
+            self.step()
+        return self.grids
+
+    # Function to get the summary statistics of every replica
+    def statistics(self):
+        return [dict(model.summary_statistics(grid), seed=seed) for grid, seed in zip(self.grids, self.seeds)]
@@ -0,0 +1,108 @@
+import numpy as np
+
+# Cell types (same values as in main.py, Test.py and Test Benthe.py)
+EMPTY = 0  # Empty cells
+MELANOPHORE = 1  # Black stripe cells (melanophores)
+XANTHOPHORE = 2  # Yellow interstripe cells (xanthophores)
+CELL_TYPES = (MELANOPHORE, XANTHOPHORE)
+
+# Function to collect the Morse potential parameters (R, A, r, a) for every pair of cell types,
+# in the same way morse_potential picks them
+def morse_parameters(RMM, RXX, RXM, AMM, AXX, AXM, DMM, DXX, DXM):
+    return {
+        (MELANOPHORE, MELANOPHORE): (RMM, AMM, DMM, DMM),
+        (XANTHOPHORE, XANTHOPHORE): (RXX, AXX, DXX, DXX),
+        (MELANOPHORE, XANTHOPHORE): (RXM, AXM, DXM, DXM),
+        (XANTHOPHORE, MELANOPHORE): (RXM, AXM, DXM, DXM),
+    }
+
+# Function to find the smallest FFT-friendly length (only factors 2, 3 and 5) of at least n
+def _fft_length(n):
+    length = n
+    while True:
+        rest = length
+        for factor in (2, 3, 5):
+            while rest % factor == 0:
+                rest //= factor
+        if rest == 1:
+            return length
+        length += 1
+
+# Function to build the x and y force kernels for one pair of cell types.
+# The kernels are indexed by the offset (i - x, j - y) + (size - 1), exactly like the
+# per-cell loop: the potential uses the (optionally wrapped) distance, the direction
+# uses the plain offset.
+def morse_kernel(shape, R, A, r, a, periodic=True):
+    di = np.arange(-(shape[0] - 1), shape[0])[:, None]
+    dj = np.arange(-(shape[1] - 1), shape[1])[None, :]
+    if periodic:
+        # Wrapped distance, as in morse_potential in main.py
+        dx = np.minimum(np.abs(di), shape[0] - np.abs(di))
+        dy = np.minimum(np.abs(dj), shape[1] - np.abs(dj))
+    else:
+        # Plain distance, as in morse_potential in Test Benthe.py
+        dx = np.abs(di)
+        dy = np.abs(dj)
+    distance = np.sqrt(dx ** 2 + dy ** 2)
+    norm = np.sqrt(di ** 2 + dj ** 2)
+
+    # No interaction if cells are at the same position
+    with np.errstate(divide='ignore', invalid='ignore'):
+        potential = np.where(distance == 0, 0.0, R * np.exp(-distance / r) - A * np.exp(-distance / a))
+        kernel_x = np.where(norm == 0, 0.0, potential * di / norm)
+        kernel_y = np.where(norm == 0, 0.0, potential * dj / norm)
+    return kernel_x, kernel_y
+
+
+# Net Morse force on every cell of the grid at once.
+# The force on the cell at (x, y) is a sum over all other cells (i, j) of a kernel that
+# only depends on the offset (i - x, j - y), so per cell type it is a correlation of the
+# occupancy map of every type with one kernel. The correlation is done with FFTs padded
+# to at least 2 * size - 1, so the offsets never alias and the result equals the
+# per-cell loop up to floating-point rounding, in O(N^2 log N) per step.
+class ForceField:
+    def __init__(self, params, periodic=True, cache_size=4):
+        self.params = params  # Output of morse_parameters
+        self.periodic = periodic  # Wrapped distance (main.py) or plain distance (Test Benthe.py)
+        self.cache_size = cache_size  # Number of grid shapes to keep kernel spectra for (the grid can grow)
+        self._spectra = {}  # Kernel spectra per grid shape, oldest first
+
+    # Function to get (and cache) the kernel spectra for a grid shape
+    def spectra(self, shape):
+        shape = tuple(shape)
+        if shape not in self._spectra:
+            length = (_fft_length(2 * shape[0] - 1), _fft_length(2 * shape[1] - 1))
+            kernels = {}
+            for pair, (R, A, r, a) in self.params.items():
+                spectrum = []
+                for kernel in morse_kernel(shape, R, A, r, a, self.periodic):
+                    # Flip so the correlation becomes a convolution, then move offset 0 to index 0
+                    padded = np.zeros(length)
+                    padded[:kernel.shape[0], :kernel.shape[1]] = kernel[::-1, ::-1]
+                    padded = np.roll(padded, (-(shape[0] - 1), -(shape[1] - 1)), axis=(0, 1))
+                    spectrum.append(np.fft.rfft2(padded))
+                kernels[pair] = spectrum
+            self._spectra[shape] = (length, kernels)
+            while len(self._spectra) > self.cache_size:
+                del self._spectra[next(iter(self._spectra))]
+        return self._spectra[shape]
+
+    # Function to calculate force_x and force_y for every cell (zero on empty positions).
+    # The grid can have leading batch axes, e.g. (replicas, rows, cols); the FFTs run over
+    # the last two axes.
+    def __call__(self, grid):
+        shape = grid.shape[-2:]
+        length, kernels = self.spectra(shape)
+        occupancy = {cell_type: np.fft.rfft2(grid == cell_type, s=length) for cell_type in CELL_TYPES}
+
+        force_x = np.zeros(grid.shape)
+        force_y = np.zeros(grid.shape)
+        for cell_type in CELL_TYPES:
+            mask = grid == cell_type
+            if not mask.any():
+                continue
+            for axis, force in enumerate((force_x, force_y)):
+                spectrum = sum(occupancy[other] * kernels[(cell_type, other)][axis] for other in CELL_TYPES)
+                field = np.fft.irfft2(spectrum, s=length)[..., :shape[0], :shape[1]]
+                force[mask] = field[mask]
+        return force_x, force_y
@@ -0,0 +1,186 @@
+import json
+import os
+import zlib
+
+import numpy as np
+
+from model import PALETTE
+
+# On-disk trajectory store: every recorded step is one uint8 frame, kept in fixed-size
+# chunks in a directory next to a metadata.json (parameters, seed, frame shape and the
+# number of chunks and frames). The step index of every frame is kept per chunk in a small
+# steps_<n>.npy, so neither the writer's memory nor the metadata grows with the run.
+# Uncompressed chunks are .npy files that are written and read through memory maps, so
+# recording uses constant memory and reading is zero-copy. Compressed chunks are
+# zlib-compressed once they are full and unpacked when read.
+
+METADATA_FILE = 'metadata.json'
+CHUNK_FRAMES = 256  # Frames per chunk
+
+# Function to get the file name of a chunk
+def _chunk_path(path, index, compressed):
+    return os.path.join(path, f"chunk_{index:06d}.{'zlib' if compressed else 'npy'}")
+
+# Function to get the file name of the step indices of a chunk
+def _steps_path(path, index):
+    return os.path.join(path, f"steps_{index:06d}.npy")
+
+# Function to write a file atomically (write a temporary file, then rename it)
+def _write_atomic(file_path, data):
+    temporary = file_path + '.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(data)
+    os.replace(temporary, file_path)
+
+
+# Records the grid of every step to a trajectory directory
+class TrajectoryWriter:
+    def __init__(self, path, frame_shape, metadata=None, chunk_frames=CHUNK_FRAMES, compress=False, compression_level=6):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.frame_shape = tuple(frame_shape)
+        self.chunk_frames = chunk_frames
+        self.compress = compress
+        self.compression_level = compression_level
+        self.metadata = dict(metadata or {})
+        self._chunk = None  # Memory map of the chunk being filled
+        self._steps = np.zeros(chunk_frames, dtype=np.int64)  # Step index of every frame in the chunk being filled
+        self._filled = 0  # Frames in the chunk being filled
+        self._chunks = 0  # Finished chunks
+        self._frames = 0  # Frames in the finished chunks
+
+    # Function to add the grid of one step
+    def append(self, grid, step):
+        if grid.shape != self.frame_shape:
+            raise ValueError(f"Frame shape {grid.shape} does not match the trajectory shape {self.frame_shape}")
+        if self._chunk is None:
+            self._chunk = np.lib.format.open_memmap(
+                _chunk_path(self.path, self._chunks, False), mode='w+', dtype=np.uint8,
+                shape=(self.chunk_frames,) + self.frame_shape,
+            )
+        self._chunk[self._filled] = grid
+        self._steps[self._filled] = step
+        self._filled += 1
+        if self._filled == self.chunk_frames:
+            self._finish_chunk()
+
+    # Function to close the chunk being filled (cut to the frames it holds) and compress it if asked
+    def _finish_chunk(self):
+        raw_path = _chunk_path(self.path, self._chunks, False)
+        chunk = self._chunk
+        self._chunk = None
+        if self.compress:
+            data = zlib.compress(np.ascontiguousarray(chunk[:self._filled]).tobytes(), self.compression_level)
+            del chunk
+            _write_atomic(_chunk_path(self.path, self._chunks, True), data)
+            os.remove(raw_path)
+        elif self._filled < self.chunk_frames:
+            frames = np.array(chunk[:self._filled])
+            del chunk
+            np.save(raw_path, frames)
+        else:
+            chunk.flush()
+            del chunk
+        np.save(_steps_path(self.path, self._chunks), self._steps[:self._filled])
+        self._chunks += 1
+        self._frames += self._filled
+        self._filled = 0
+        self._write_metadata()
+
+    # Function to write metadata.json, so a trajectory is readable up to the last finished chunk
+    def _write_metadata(self):
+        metadata = dict(
+            self.metadata,
+            frame_shape=list(self.frame_shape),
+            chunk_frames=self.chunk_frames,
+            compressed=self.compress,
+            chunks=self._chunks,
+            frames=self._frames,
+        )
+        _write_atomic(os.path.join(self.path, METADATA_FILE), json.dumps(metadata).encode())
+
+    # Function to finish the last chunk and write the metadata
+    def close(self):
+        if self._chunk is not None:
+            self._finish_chunk()
+        else:
+            self._write_metadata()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Reads frames from a trajectory directory without re-simulating
+class TrajectoryReader:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, METADATA_FILE)) as file:
+            self.metadata = json.load(file)
+        self.frame_shape = tuple(self.metadata['frame_shape'])
+        self.chunk_frames = self.metadata['chunk_frames']
+        self.compressed = self.metadata['compressed']
+        self._cached = (None, None)  # Last unpacked compressed chunk
+
+    def __len__(self):
+        return self.metadata['frames']
+
+    # Function to get one chunk, memory-mapped or unpacked
+    def chunk(self, index):
+        if not self.compressed:
+            return np.load(_chunk_path(self.path, index, False), mmap_mode='r')
+        if self._cached[0] != index:
+            with open(_chunk_path(self.path, index, True), 'rb') as file:
+                frames = np.frombuffer(zlib.decompress(file.read()), dtype=np.uint8)
+            self._cached = (index, frames.reshape((-1,) + self.frame_shape))
+        return self._cached[1]
+
+    # Function to get the step indices of the frames in one chunk
+    def chunk_steps(self, index):
+        return np.load(_steps_path(self.path, index))
+
+    # Step index of every frame
+    @property
+    def steps(self):
+        return np.concatenate([np.zeros(0, dtype=np.int64)] + [self.chunk_steps(index) for index in range(self.metadata['chunks'])])
+
+    # Function to get the frame with the given index (a read-only view into its chunk)
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.chunk(index // self.chunk_frames)[index % self.chunk_frames]
+
+    # Function to go through all frames in order, one chunk at a time
+    def __iter__(self):
+        for index in range(self.metadata['chunks']):
+            yield from self.chunk(index)
+
+    # Function to save the recorded frames as a video, rendered straight from the frames and
+    # piped to ffmpeg (see render.py); annotated=True goes through matplotlib instead
+    def save_video(self, file_path, fps=30, bitrate=1800, interval=200, scale=4, workers=None, annotated=False):
+        if not annotated:
+            from render import write_video
+
+            write_video(iter(self), file_path, self.frame_shape, fps, bitrate, scale, workers)
+            return
+        import matplotlib.animation as animation
+        import matplotlib.pyplot as plt
+        from matplotlib import colors
+        from matplotlib.animation import FFMpegWriter
+
+        fig, ax = plt.subplots(figsize=(6, 6))
+        cax = ax.imshow(self[0], cmap=colors.ListedColormap(PALETTE), vmin=0, vmax=len(PALETTE) - 1)
+
+        # Update function for animation
+        def update(frame):
+            cax.set_array(self[frame])
+            return [cax]
+
+        ani = animation.FuncAnimation(fig, update, frames=len(self), interval=interval, blit=True)
+        writer = FFMpegWriter(fps=fps, metadata={'artist': 'Benthe & Julius'}, bitrate=bitrate)
+        ani.save(file_path, writer=writer)
+        plt.close(fig)
@@ -0,0 +1,42 @@
+import numpy as np
+
+# Growing domain for the fish-growth model: one buffer is allocated at the final size
+# up front and the simulated grid is a view on its centre that widens by one ring of
+# cells per growth. Growing never allocates or copies; the new border is already empty
+# because nothing outside the active region is ever written.
+class GrowingDomain:
+    def __init__(self, initial_shape, final_shape, dtype=int):
+        if any(final < initial for initial, final in zip(initial_shape, final_shape)):
+            raise ValueError(f"Final shape {final_shape} is smaller than the initial shape {initial_shape}")
+        self.buffer = np.zeros(final_shape, dtype=dtype)
+        self.final_shape = tuple(final_shape)
+
+        # Start and end of the active region per axis, centred in the buffer
+        self.start = [(final - initial) // 2 for initial, final in zip(initial_shape, final_shape)]
+        self.end = [start + initial for start, initial in zip(self.start, initial_shape)]
+
+    # The active region, a view into the buffer
+    @property
+    def active(self):
+        return self.buffer[self.start[0]:self.end[0], self.start[1]:self.end[1]]
+
+    @property
+    def shape(self):
+        return tuple(end - start for start, end in zip(self.start, self.end))
+
+    # Function to widen the active region by one cell on every side (per axis that still has room).
+    # Returns False once the domain has reached its final size.
+    def grow(self):
+        grown = False
+        for axis in range(2):
+            if self.start[axis] > 0 and self.end[axis] < self.final_shape[axis]:
+                self.start[axis] -= 1
+                self.end[axis] += 1
+                grown = True
+        return grown
+
+    # Function to replace the active region with the result of one update step
+    def step(self, update):
+        active = self.active
+        active[...] = update(active)
+        return active
@@ -0,0 +1,114 @@
+import numpy as np
+
+from forces import EMPTY, MELANOPHORE, XANTHOPHORE
+from rules import RULE_VARIANTS, _dies, _majority, _neighborhood_sum, draw_births
+
+# Incremental evaluation of the local rules. Instead of recounting the neighbours of
+# every cell each step, the neighbour counts are kept in maps that are only updated
+# around the cells that changed in the last step, and the death checks and
+# differentiation majorities are only re-evaluated in the 3x3 neighbourhoods of those
+# cells. The empty cells that can differentiate are kept as a sorted set of candidates,
+# so the 5% draws still happen once per candidate in raster order. Results are the same
+# as death_mask and differentiation_majority on the full grid.
+
+# Offsets of the 3x3 neighbourhood, including the cell itself
+BOX_OFFSETS = [(i, j) for i in (-1, 0, 1) for j in (-1, 0, 1)]
+
+
+class IncrementalRules:
+    def __init__(self, grid, variant='main'):
+        self.variant = variant
+        self.rules = RULE_VARIANTS[variant]
+        self.grid = grid.copy()
+        rows, cols = grid.shape
+
+        # Clipped 3x3 counts including the cell itself (death checks, and clipped neighbour counts)
+        self.box = {cell_type: _neighborhood_sum(grid == cell_type, 'clip', include_center=True)
+                    for cell_type in (MELANOPHORE, XANTHOPHORE)}
+        # Wrapped 8-neighbour counts, only needed for wrapped differentiation
+        self.wrapped = None
+        if self.rules['differentiation_border'] == 'wrap':
+            self.wrapped = {cell_type: _neighborhood_sum(grid == cell_type, 'wrap')
+                            for cell_type in (MELANOPHORE, XANTHOPHORE)}
+
+        # Position of the cell at slice index [1, 1] for the 'slice' death counts of main.py
+        self.quirk_rows = np.arange(rows) + (np.arange(rows) == 0)
+        self.quirk_cols = np.arange(cols) + (np.arange(cols) == 0)
+
+        self.dies = np.zeros(grid.shape, dtype=bool)
+        self.majority = np.zeros_like(grid)
+        self.candidates = np.zeros(0, dtype=np.int64)
+        self._evaluate(np.arange(grid.size))
+
+    # Function to re-evaluate the death checks and majorities at the given flat indices
+    def _evaluate(self, cells):
+        grid = self.grid
+        x, y = np.unravel_index(cells, grid.shape)
+        values = grid[x, y]
+        is_melanophore = values == MELANOPHORE
+        is_xanthophore = values == XANTHOPHORE
+
+        # Death checks
+        box_melanophores = self.box[MELANOPHORE][x, y]
+        box_xanthophores = self.box[XANTHOPHORE][x, y]
+        neighborhood = self.rules['death_neighborhood']
+        if neighborhood == 'slice':
+            quirk = grid[self.quirk_rows[x], self.quirk_cols[y]]
+            melanophores = box_melanophores - (quirk == MELANOPHORE)
+            xanthophores = box_xanthophores - (quirk == XANTHOPHORE)
+        elif neighborhood == 'box':
+            melanophores, xanthophores = box_melanophores, box_xanthophores
+        else:
+            melanophores = box_melanophores - is_melanophore
+            xanthophores = box_xanthophores - is_xanthophore
+        self.dies[x, y] = _dies(is_melanophore, is_xanthophore, melanophores, xanthophores, self.rules)
+
+        # Differentiation majorities and the candidate set
+        border = self.rules['differentiation_border']
+        if border is None:
+            return
+        if border == 'wrap':
+            melanophores = self.wrapped[MELANOPHORE][x, y]
+            xanthophores = self.wrapped[XANTHOPHORE][x, y]
+        else:
+            melanophores = box_melanophores - is_melanophore
+            xanthophores = box_xanthophores - is_xanthophore
+        majority = np.where(values == EMPTY, _majority(melanophores, xanthophores), EMPTY)
+        self.majority[x, y] = majority
+        kept = self.candidates[~np.isin(self.candidates, cells)]
+        self.candidates = np.union1d(kept, cells[majority != EMPTY])
+
+    # Function to draw the new cells of this step from the candidate set
+    def births(self, random_source, step=None):
+        return draw_births(self.majority, self.variant, random_source, self.candidates, step)
+
+    # Function to move on to the next grid: update the counts around the changed cells and
+    # re-evaluate the rules in their 3x3 neighbourhoods
+    def update(self, new_grid):
+        changed = np.flatnonzero(new_grid != self.grid)
+        if changed.size == 0:
+            return
+        rows, cols = new_grid.shape
+        x, y = np.unravel_index(changed, new_grid.shape)
+        old = self.grid[x, y]
+        new = new_grid[x, y]
+        self.grid = new_grid.copy()
+
+        dirty = []
+        for i, j in BOX_OFFSETS:
+            # Clipped counts include the cell itself and skip positions outside the grid
+            nx, ny = x + i, y + j
+            inside = (nx >= 0) & (nx < rows) & (ny >= 0) & (ny < cols)
+            for cell_type, counts in self.box.items():
+                delta = (new == cell_type).astype(np.int64) - (old == cell_type)
+                np.add.at(counts, (nx[inside], ny[inside]), delta[inside])
+
+            # Wrapped counts exclude the cell itself
+            wx, wy = nx % rows, ny % cols
+            if self.wrapped is not None and (i, j) != (0, 0):
+                for cell_type, counts in self.wrapped.items():
+                    delta = (new == cell_type).astype(np.int64) - (old == cell_type)
+                    np.add.at(counts, (wx, wy), delta)
+            dirty.append(wx * cols + wy)
+
+        self._evaluate(np.unique(np.concatenate(dirty)))
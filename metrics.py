@@ -0,0 +1,77 @@
+import numpy as np
+
+from forces import EMPTY, MELANOPHORE, XANTHOPHORE
+
+# Stripe metrics computed while the simulation runs, and a stopping policy that ends a
+# run once the pattern has settled, so sweeps only spend steps where the dynamics are
+# still changing.
+
+# Function to estimate the dominant stripe wavelength and orientation from the power
+# spectrum of the melanophore map. The wavelength is in cells; the orientation is the
+# angle of the stripes in degrees, 0 for stripes along the rows (varying from row to
+# row, like the initial stripes) and 90 for stripes along the columns.
+def dominant_stripe(grid):
+    signal = (grid == MELANOPHORE).astype(float)
+    signal -= signal.mean()
+    power = np.abs(np.fft.rfft2(signal)) ** 2
+    power[0, 0] = 0.0  # Ignore the mean
+    if not power.any():
+        return None, None
+
+    row_frequency, col_frequency = np.unravel_index(np.argmax(power), power.shape)
+    # Frequencies above half the grid size are negative frequencies along the rows
+    if row_frequency > grid.shape[0] // 2:
+        row_frequency -= grid.shape[0]
+    kx = row_frequency / grid.shape[0]
+    ky = col_frequency / grid.shape[1]
+    wavelength = 1.0 / np.hypot(kx, ky)
+    # The wave vector points across the stripes, the stripes run perpendicular to it
+    orientation = (np.degrees(np.arctan2(ky, kx))) % 180.0
+    return float(wavelength), float(orientation)
+
+# Function to calculate the metrics of one grid. Pass the previous grid to also get the
+# fraction of cells that changed in the last step.
+def pattern_metrics(grid, previous=None):
+    metrics = {
+        'melanophores': int(np.count_nonzero(grid == MELANOPHORE)),
+        'xanthophores': int(np.count_nonzero(grid == XANTHOPHORE)),
+        'empty': int(np.count_nonzero(grid == EMPTY)),
+        # Fraction of every row covered by each cell type
+        'melanophore_profile': (grid == MELANOPHORE).mean(axis=1),
+        'xanthophore_profile': (grid == XANTHOPHORE).mean(axis=1),
+    }
+    metrics['wavelength'], metrics['orientation'] = dominant_stripe(grid)
+    metrics['changed'] = None if previous is None else float(np.mean(grid != previous))
+    return metrics
+
+
+# Stopping policy: the pattern is steady once, over the last `window` steps, the fraction
+# of changed cells stayed below change_tolerance, the cell counts varied by less than
+# count_tolerance (relative) and the dominant wavelength did not move by more than
+# wavelength_tolerance cells. Never stops before min_steps.
+class SteadyState:
+    def __init__(self, window=10, change_tolerance=0.002, count_tolerance=0.01, wavelength_tolerance=0.5, min_steps=20):
+        self.window = window
+        self.change_tolerance = change_tolerance
+        self.count_tolerance = count_tolerance
+        self.wavelength_tolerance = wavelength_tolerance
+        self.min_steps = min_steps
+        self.history = []
+
+    # Function to add the metrics of the next step; returns True once the pattern is steady
+    def update(self, metrics):
+        self.history.append(metrics)
+        if len(self.history) < max(self.min_steps, self.window):
+            return False
+        recent = self.history[-self.window:]
+
+        if any(entry['changed'] is None or entry['changed'] > self.change_tolerance for entry in recent):
+            return False
+        for key in ('melanophores', 'xanthophores'):
+            values = [entry[key] for entry in recent]
+            if max(values) - min(values) > self.count_tolerance * max(1, max(values)):
+                return False
+        wavelengths = [entry['wavelength'] for entry in recent]
+        if None in wavelengths:
+            return len(set(wavelengths)) == 1
+        return max(wavelengths) - min(wavelengths) <= self.wavelength_tolerance
@@ -0,0 +1,321 @@
+import functools
+import os
+import random
+
+import numpy as np
+
+from agents import SparseForceField
+from backends import commit_numpy, select_backend
+from counter_rng import CounterRNG
+from forces import EMPTY, MELANOPHORE, XANTHOPHORE, ForceField, morse_parameters
+from moves import MOVE_POLICIES, commit_batched, move_priority
+from rules import death_mask, differentiation
+
+# Headless version of the model in main.py: no plotting and no module-level grid,
+# the grid size comes from the grid itself and the parameters are passed in.
+
+# Length scales for cellular interactions (same as main.py)
+DMM = 50  # Average distance between melanophores
+DXX = 36  # Average distance between xanthophores
+DXM = 82  # Average distance between melanophores and xanthophores at stripe/interstripe boundaries
+
+# Initial conditions that can be picked by name
+INITIAL_CONDITIONS = ('stripes', 'random')
+STRIPES_MIN_ROWS = 33  # The stripe layout has stripes 16 rows above and below the middle row
+DRAWS = ('stream', 'counter')  # random.Random stream in raster order, or counter_rng.CounterRNG
+
+# Force engines that can be picked by name: 'fft' sums over the whole grid with FFTs,
+# 'sparse' only sums over pairs within a cutoff radius (see agents.py)
+FORCE_ENGINES = ('fft', 'sparse')
+
+# Function to build the wrapped-distance force field for one set of Morse strengths
+def make_force_field(RMM, RXX, RXM, AMM, AXX, AXM, DMM=DMM, DXX=DXX, DXM=DXM, engine='fft', cutoff=None):
+    params = morse_parameters(RMM, RXX, RXM, AMM, AXX, AXM, DMM, DXX, DXM)
+    if engine == 'fft':
+        return ForceField(params, periodic=True)
+    if engine == 'sparse':
+        return SparseForceField(params, periodic=True, cutoff=cutoff)
+    raise ValueError(f"Unknown force engine {engine!r}, expected one of {FORCE_ENGINES}")
+
+# Function to initialize cells, either the stripe layout of main.py or randomly placed cells
+def initialize_cells(grid, layout='stripes', rng=random, num_melanophores=100, num_xanthophores=100):
+    rows, cols = grid.shape
+    if layout == 'stripes':
+        if rows < STRIPES_MIN_ROWS:
+            raise ValueError(f"The stripe layout needs at least {STRIPES_MIN_ROWS} rows, the grid has {rows}")
+
+        # Top and bottom rows are melanophores with empty spaces between each cell
+        grid[0, ::2] = MELANOPHORE
+        grid[rows - 1, ::2] = MELANOPHORE
+
+        # Middle row and the rows 16 above and below it are xanthophores
+        middle_row = rows // 2
+        grid[middle_row, :] = XANTHOPHORE
+        grid[middle_row - 16, :] = XANTHOPHORE
+        grid[middle_row + 16, :] = XANTHOPHORE
+
+        # Rows 7 above and below the middle row are melanophores with gaps
+        grid[middle_row - 7, ::2] = MELANOPHORE
+        grid[middle_row + 7, ::2] = MELANOPHORE
+    elif layout == 'random' and isinstance(rng, CounterRNG):
+        # One keyed draw per placement, so the layout does not depend on the order of the draws
+        placements = np.arange(num_melanophores + num_xanthophores)
+        x = rng.integers(0, 'initial', 2 * placements, rows)
+        y = rng.integers(0, 'initial', 2 * placements + 1, cols)
+        grid[x[:num_melanophores], y[:num_melanophores]] = MELANOPHORE
+        grid[x[num_melanophores:], y[num_melanophores:]] = XANTHOPHORE
+    elif layout == 'random':
+        # Randomly place melanophores and xanthophores
+        for _ in range(num_melanophores):
+            x, y = rng.randint(0, rows - 1), rng.randint(0, cols - 1)
+            grid[x, y] = MELANOPHORE
+        for _ in range(num_xanthophores):
+            x, y = rng.randint(0, rows - 1), rng.randint(0, cols - 1)
+            grid[x, y] = XANTHOPHORE
+    else:
+        raise ValueError(f"Unknown initial condition {layout!r}, expected one of {INITIAL_CONDITIONS}")
+    return grid
+
+# Function to calculate where every cell moves to based on the forces (scaled for simplicity),
+# for the rows starting at first_row, clipped to the grid (works on the last two axes)
+def move_targets(force_x_field, force_y_field, shape, first_row=0):
+    x = np.arange(first_row, first_row + force_x_field.shape[-2])[:, None]
+    y = np.arange(force_x_field.shape[-1])[None, :]
+    target_x = np.clip(x + np.trunc(force_x_field * 0.1).astype(np.int64), 0, shape[-2] - 1)
+    target_y = np.clip(y + np.trunc(force_y_field * 0.1).astype(np.int64), 0, shape[-1] - 1)
+    return target_x, target_y
+
+# Function to update the grid based on interaction rules (the update_grid of main.py).
+# random_source is a function giving one uniform draw per call, or a counter_rng.CounterRNG
+# (which needs the step number). moves picks the move policy (see moves.py).
+def update_grid(grid, force_field, random_source=random.random, commit=commit_numpy, profiler=None, step=None,
+                local_rules=None, moves='raster'):
+    # Optional per-phase timing and event counters (see profiling.py)
+    if profiler is not None:
+        profiler.start(step)
+
+    # Calculate the net force on every cell based on the Morse potential
+    force_x_field, force_y_field = force_field(grid)
+    if profiler is not None:
+        profiler.lap('forces')
+
+    # Death and differentiation rules for the whole grid at once, or only around the cells
+    # that changed since the last step (see incremental.py)
+    if local_rules is None:
+        dies = death_mask(grid, 'main')
+    else:
+        local_rules.update(grid)
+        dies = local_rules.dies
+    if profiler is not None:
+        profiler.lap('death')
+    if local_rules is None:
+        births = differentiation(grid, 'main', random_source, step)
+    else:
+        births = local_rules.births(random_source, step)
+    if profiler is not None:
+        profiler.lap('differentiation')
+
+    # Target of every cell based on the calculated forces
+    target_x, target_y = move_targets(force_x_field, force_y_field, grid.shape)
+    if profiler is not None:
+        profiler.lap('targets')
+
+    # Deaths, moves and new cells in raster order (see backends.py), or all moves at once
+    # with collisions resolved by priority (see moves.py)
+    if moves != 'raster':
+        commit = functools.partial(commit_batched, priority=move_priority(moves, force_x_field, force_y_field,
+                                                                         random_source, step))
+    if profiler is None:
+        return commit(grid, dies, births, target_x, target_y)
+    counts = np.zeros(2, dtype=np.int64)
+    new_grid = commit(grid, dies, births, target_x, target_y, counts)
+    profiler.lap('commit')
+    profiler.finish(died=int(np.count_nonzero(dies)), moved=int(counts[0]), blocked=int(counts[1]),
+                    born=int(np.count_nonzero(births)))
+    return new_grid
+
+# Function to get what update_grid draws from: the random.Random stream or the CounterRNG itself
+def random_source(rng):
+    return rng if isinstance(rng, CounterRNG) else rng.random
+
+# Function to calculate summary statistics of a grid
+def summary_statistics(grid):
+    return {
+        'melanophores': int(np.sum(grid == MELANOPHORE)),
+        'xanthophores': int(np.sum(grid == XANTHOPHORE)),
+        'empty': int(np.sum(grid == EMPTY)),
+    }
+
+
+# Colors used to draw empty cells, melanophores and xanthophores
+PALETTE = ['white', 'black', 'yellow']
+
+
+# One run of the model: the grid, its parameters, its own random generator and the step
+# counter. Nothing here imports matplotlib; the plotting stack is only loaded by the
+# visualisation methods, so headless workers start quickly.
+class Simulation:
+    def __init__(self, grid_size=(50, 50), RMM=0.001, RXX=0.001, RXM=0.001, AMM=0.001, AXX=0.001, AXM=0.001,
+                 DMM=DMM, DXX=DXX, DXM=DXM, initial='stripes', seed=None, grid=None, engine='fft', cutoff=None,
+                 backend='numpy', incremental=False, draws='stream', moves='raster'):
+        self.params = dict(RMM=RMM, RXX=RXX, RXM=RXM, AMM=AMM, AXX=AXX, AXM=AXM, DMM=DMM, DXX=DXX, DXM=DXM)
+        self.initial = initial
+        if draws not in DRAWS:
+            raise ValueError(f"Unknown draws {draws!r}, expected one of {DRAWS}")
+        self.draws = draws
+        if moves not in MOVE_POLICIES:
+            raise ValueError(f"Unknown move policy {moves!r}, expected one of {MOVE_POLICIES}")
+        if moves == 'random' and draws != 'counter':
+            raise ValueError("The 'random' move policy needs counter-based draws (draws='counter')")
+        self.moves = moves
+        # Own random generator, so runs with the same seed are identical
+        self.rng = random.Random(seed) if draws == 'stream' else CounterRNG(seed)
+        self.seed = seed if draws == 'stream' else self.rng.seed
+        self.engine = engine
+        self.cutoff = cutoff
+        self.force_field = make_force_field(**self.params, engine=engine, cutoff=cutoff)
+        self.commit = select_backend(backend)  # 'auto' for the compiled commit loop if available, see backends.py
+        self.profiler = None  # Set to a profiling.StepProfiler to time phases and count events
+        self.incremental = incremental  # Only re-evaluate the local rules around changed cells
+        self.local_rules = None
+        self.step_count = 0
+        if grid is None:
+            grid = initialize_cells(np.zeros(grid_size, dtype=int), initial, self.rng)
+        self.grid = grid
+
+    # Function to advance the simulation by one step
+    def step(self):
+        if self.incremental and self.local_rules is None:
+            from incremental import IncrementalRules
+
+            self.local_rules = IncrementalRules(self.grid, 'main')
+        self.grid = update_grid(self.grid, self.force_field, random_source(self.rng), self.commit, self.profiler, self.step_count + 1,
+                                self.local_rules, self.moves)
+        self.step_count += 1
+        return self.grid
+
+    # Function to advance the simulation by n steps, optionally giving every new grid to a
+    # recorder (for example a framestore.TrajectoryWriter) and writing a checkpoint every
+    # checkpoint_every steps
+    def run(self, n, recorder=None, checkpoint_path=None, checkpoint_every=None):
+        for _ in range(n):
+            self.step()
+            if recorder is not None:
+                recorder.append(self.grid, self.step_count)
+            if checkpoint_path is not None and checkpoint_every and self.step_count % checkpoint_every == 0:
+                self.save_checkpoint(checkpoint_path)
+        return self.grid
+
+    # Function to write the grid, step counter, random state and parameters to a checkpoint
+    def save_checkpoint(self, path):
+        from checkpoint import save_checkpoint
+
+        rng_state = self.rng.getstate() if self.draws == 'stream' else None  # Counter draws only need the seed
+        save_checkpoint(path, self.grid, self.step_count, rng_state, params=self.params,
+                        initial=self.initial, seed=self.seed, engine=self.engine, cutoff=self.cutoff, draws=self.draws,
+                        moves=self.moves)
+
+    # Function to continue a simulation from a checkpoint; the following steps are identical
+    # to the ones the original run would have taken
+    @classmethod
+    def from_checkpoint(cls, path, backend='numpy', incremental=False):
+        from checkpoint import load_checkpoint
+
+        state = load_checkpoint(path)
+        simulation = cls(state['grid'].shape, **state['params'], initial=state['initial'], seed=state['seed'],
+                         grid=state['grid'], engine=state['engine'], cutoff=state['cutoff'], backend=backend,
+                         incremental=incremental, draws=state.get('draws', 'stream'),
+                         moves=state.get('moves', 'raster'))
+        if state['rng_state'] is not None:
+            simulation.rng.setstate(state['rng_state'])
+        simulation.step_count = state['step']
+        return simulation
+
+    # Function to run until the pattern is steady (see metrics.SteadyState) or max_steps is
+    # reached. The metrics are computed every `every` steps. Returns the list of metrics.
+    def run_until_steady(self, max_steps, policy=None, every=1, recorder=None):
+        from metrics import SteadyState, pattern_metrics
+
+        policy = policy or SteadyState()
+        history = []
+        previous = self.grid
+        for _ in range(max_steps):
+            self.step()
+            if recorder is not None:
+                recorder.append(self.grid, self.step_count)
+            if self.step_count % every == 0:
+                metrics = dict(pattern_metrics(self.grid, previous), step=self.step_count)
+                history.append(metrics)
+                if policy.update(metrics):
+                    break
+            previous = self.grid
+        return history
+
+    # Function to get the parameters, seed and initial condition of this run
+    def metadata(self):
+        return dict(self.params, initial=self.initial, seed=self.seed, draws=self.draws, moves=self.moves)
+
+    # Function to run n steps and store the current grid and every new grid on disk
+    def record(self, path, n, chunk_frames=256, compress=False):
+        from framestore import TrajectoryWriter
+
+        with TrajectoryWriter(path, self.grid.shape, self.metadata(), chunk_frames, compress) as recorder:
+            recorder.append(self.grid, self.step_count)
+            self.run(n, recorder)
+        if self.profiler is not None:
+            self.profiler.to_csv(os.path.join(path, 'profile.csv'))  # Phase times and counters next to the frames
+        return self.grid
+
+    # Function to calculate summary statistics of the current grid
+    def statistics(self):
+        return summary_statistics(self.grid)
+
+    # Function to visualize the current grid
+    def plot(self, ax=None):
+        import matplotlib.pyplot as plt
+        from matplotlib import colors
+
+        if ax is None:
+            ax = plt.gca()
+        return ax.imshow(self.grid, cmap=colors.ListedColormap(PALETTE), vmin=0, vmax=len(PALETTE) - 1)
+
+    # Function to make an animation that advances the simulation one step per frame
+    def animate(self, steps, interval=200):
+        import matplotlib.animation as animation
+        import matplotlib.pyplot as plt
+
+        fig, ax = plt.subplots(figsize=(6, 6))
+        cax = self.plot(ax)
+
+        # Update function for animation
+        def update(frame):
+            self.step()
+            cax.set_array(self.grid)
+            return [cax]
+
+        return animation.FuncAnimation(fig, update, frames=steps, interval=interval, blit=True)
+
+    # Function to run the simulation for a number of steps and save it as a video. Frames are
+    # rendered straight from the grid and piped to ffmpeg (see render.py), each cell scale x
+    # scale pixels; annotated=True goes through matplotlib instead.
+    def save_video(self, file_path, steps, fps=30, bitrate=1800, scale=4, workers=None, annotated=False):
+        if annotated:
+            from matplotlib.animation import FFMpegWriter
+
+            writer = FFMpegWriter(fps=fps, metadata={'artist': 'Benthe & Julius'}, bitrate=bitrate)
+            self.animate(steps).save(file_path, writer=writer)
+            return
+        from render import write_video
+
+        # Generator that advances the simulation one step per frame
+        def frames():
+            for _ in range(steps):
+                yield self.step()
+
+        write_video(frames(), file_path, self.grid.shape, fps, bitrate, scale, workers)
+
+    # Function to show the animation inline in a notebook
+    def show_html(self, steps, interval=200):
+        from IPython.display import HTML
+
+        return HTML(self.animate(steps, interval).to_jshtml())
@@ -0,0 +1,91 @@
+import numpy as np
+
+from counter_rng import CounterRNG
+from forces import EMPTY
+
+# Batched commit of deaths, moves and new cells. Instead of visiting cells in raster
+# order (backends.py), where the earlier cell wins every collision, all proposed moves
+# are resolved together with array scatter operations:
+#   1. cells in the death mask die and new cells appear on their empty positions;
+#   2. every surviving cell with a target other than its own position proposes a move;
+#      proposals to an empty target compete, and the proposal with the highest priority
+#      wins (ties go to the lowest cell index); all winning moves are applied at once;
+#   3. step 2 repeats for the proposals to the positions the winners left, until no more
+#      moves are accepted.
+# Every round only sorts the proposals that can still win, so a chain of cells that push
+# each other along one row costs one small round per cell, not a pass over the grid.
+# The result does not depend on the order in which cells are stored or visited, only on
+# the priorities. Move policies:
+#   'raster' - the raster-order commit of the chosen backend (the original behaviour)
+#   'force'  - priority by the magnitude of the net force on the cell
+#   'random' - priority by a counter-based draw keyed by seed, step and cell (needs a
+#              counter_rng.CounterRNG as random source)
+MOVE_POLICIES = ('raster', 'force', 'random')
+
+# Function to get the priority of every cell's move for a policy. The fields can be a strip
+# of rows of the grid starting at first_row.
+def move_priority(policy, force_x_field, force_y_field, random_source=None, step=None, first_row=0):
+    if policy == 'force':
+        return np.hypot(force_x_field, force_y_field)
+    if policy == 'random':
+        if not isinstance(random_source, CounterRNG):
+            raise ValueError("The 'random' move policy needs counter-based draws (draws='counter')")
+        shape = force_x_field.shape
+        return random_source.block(step, 'moves', shape[:-2] + (first_row + shape[-2], shape[-1]), first_row)
+    raise ValueError(f"Unknown move policy {policy!r}, expected one of {MOVE_POLICIES}")
+
+# Function to commit deaths, new cells and all moves at once. Same inputs as the backends
+# in backends.py plus the priority of every cell's move (no priority means every move has
+# the same priority); counts (an int64 array of length 2) gets the number of moved and
+# blocked cells added to it. The arrays can have a leading replica axis (replicas, rows,
+# cols); cells only move within their own replica, and every replica gets the same result
+# as it would on its own.
+def commit_batched(grid, dies, births, target_x, target_y, counts=None, priority=None, max_rounds=None):
+    if priority is None:
+        priority = np.zeros(grid.shape)
+    occupied = grid != EMPTY
+    new_grid = np.where(occupied & dies, EMPTY, grid)
+    new_grid = np.where(~occupied & (births != EMPTY), births, new_grid)
+    flat = new_grid.reshape(-1)
+
+    # Proposed moves of the surviving cells, as flat indices (offset by the first cell of the replica)
+    rows, cols = grid.shape[-2:]
+    source = np.flatnonzero(occupied & ~dies)
+    target = source - source % (rows * cols) + target_x.flat[source] * cols + target_y.flat[source]
+    moving = source != target
+    source, target = source[moving], target[moving]
+    rank = priority.flat[source]
+
+    # Proposals sorted by target, to find the proposals for a set of positions
+    by_target = np.argsort(target, kind='stable')
+    sorted_target = target[by_target]
+
+    # A position only becomes free when the cell on it moves away, and a proposal whose target
+    # is taken by another cell stays blocked, so after the first round only the proposals for
+    # the positions the last winners left can win. Each round only looks at those.
+    candidates = np.flatnonzero(flat[target] == EMPTY)
+    moved = 0
+    rounds = 0
+    while candidates.size and (max_rounds is None or rounds < max_rounds):
+        rounds += 1
+
+        # Highest priority per target, then the lowest source index among the proposals with it
+        candidates = candidates[np.lexsort((source[candidates], -rank[candidates], target[candidates]))]
+        targets = target[candidates]
+        winners = candidates[np.concatenate(([True], targets[1:] != targets[:-1]))]
+
+        # Apply all winning moves together
+        flat[target[winners]] = flat[source[winners]]
+        flat[source[winners]] = EMPTY
+        moved += winners.size
+
+        # Proposals for the positions just left
+        first = np.searchsorted(sorted_target, source[winners], side='left')
+        sizes = np.searchsorted(sorted_target, source[winners], side='right') - first
+        offsets = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        candidates = by_target[np.repeat(first, sizes) + offsets]
+
+    if counts is not None:
+        counts[0] += moved
+        counts[1] += source.size - moved
+    return new_grid
@@ -0,0 +1,61 @@
+import csv
+import json
+import time
+
+# Opt-in instrumentation for update_grid: time per phase and event counters per step.
+# update_grid only touches the profiler when one is passed in, so runs without one pay
+# nothing but a few `is not None` checks.
+#   Phases:   forces (Morse force field), death (death checks), differentiation
+#             (neighbour majority and draws), targets (move targets), commit (deaths,
+#             moves and new cells written to the new grid)
+#   Counters: died, moved, blocked (a living cell whose target was taken), born
+PHASES = ('forces', 'death', 'differentiation', 'targets', 'commit')
+COUNTERS = ('died', 'moved', 'blocked', 'born')
+
+
+class StepProfiler:
+    def __init__(self, callback=None, keep=True):
+        self.callback = callback  # Called with the record of every step
+        self.keep = keep  # Keep all records in memory (for to_json/to_csv)
+        self.records = []
+        self._record = None
+        self._last = 0.0
+
+    # Function to start timing a step
+    def start(self, step):
+        self._record = dict({phase: 0.0 for phase in PHASES}, step=step)
+        self._last = time.perf_counter()
+
+    # Function to add the time since the previous lap to a phase
+    def lap(self, phase):
+        now = time.perf_counter()
+        self._record[phase] += now - self._last
+        self._last = now
+
+    # Function to finish a step with its event counters
+    def finish(self, **counters):
+        record = self._record
+        record.update(counters)
+        record['total'] = sum(record[phase] for phase in PHASES)
+        self._record = None
+        if self.keep:
+            self.records.append(record)
+        if self.callback is not None:
+            self.callback(record)
+        return record
+
+    # Function to get the total time per phase over all kept steps
+    def totals(self):
+        return {phase: sum(record[phase] for record in self.records) for phase in PHASES}
+
+    # Function to write the kept records as JSON
+    def to_json(self, file_path):
+        with open(file_path, 'w') as file:
+            json.dump(self.records, file, indent=2)
+
+    # Function to write the kept records as CSV
+    def to_csv(self, file_path):
+        with open(file_path, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=['step', *PHASES, 'total', *COUNTERS])
+            writer.writeheader()
+            writer.writerows(self.records)
@@ -0,0 +1,91 @@
+import collections
+import multiprocessing
+import os
+import subprocess
+
+import numpy as np
+
+from model import PALETTE
+
+# Direct video rendering without matplotlib. Every grid is mapped through the palette
+# straight to an RGB frame (one lookup per cell, then integer upscaling), frames are
+# produced by a pool of worker processes and streamed in order as raw rgb24 frames into
+# an ffmpeg subprocess, so writing a video is bounded by the encoder. Only a small window
+# of frames is in flight at any time, so memory does not grow with the video length.
+
+# RGB colours of the palette in model.PALETTE (white, black, yellow)
+COLOURS = {'white': (255, 255, 255), 'black': (0, 0, 0), 'yellow': (255, 255, 0)}
+PALETTE_RGB = np.array([COLOURS[name] for name in PALETTE], dtype=np.uint8)
+
+# Function to turn a grid into an RGB frame, every cell scale x scale pixels. The frame is
+# padded with white to an even size, which the yuv420p pixel format needs.
+def to_rgb(grid, scale=1):
+    frame = PALETTE_RGB[grid]
+    if scale > 1:
+        frame = np.repeat(np.repeat(frame, scale, axis=0), scale, axis=1)
+    rows, cols = frame.shape[:2]
+    if rows % 2 or cols % 2:
+        frame = np.pad(frame, ((0, rows % 2), (0, cols % 2), (0, 0)), constant_values=255)
+    return frame
+
+# Function to render one frame in a worker (arguments packed for Pool.imap)
+def _render(task):
+    grid, scale = task
+    return to_rgb(grid, scale).tobytes()
+
+# Function to get the size (width, height) of the video for a grid shape
+def frame_size(shape, scale=1):
+    rows, cols = shape[0] * scale, shape[1] * scale
+    return cols + cols % 2, rows + rows % 2
+
+# Function to build the ffmpeg command line for raw rgb24 frames on stdin
+def ffmpeg_command(file_path, size, fps=30, bitrate=1800, codec='libx264', ffmpeg='ffmpeg'):
+    command = [ffmpeg, '-y', '-loglevel', 'error',
+               '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{size[0]}x{size[1]}', '-r', str(fps), '-i', '-',
+               '-c:v', codec, '-pix_fmt', 'yuv420p']
+    if bitrate:
+        command += ['-b:v', f'{bitrate}k']
+    return command + ['-metadata', 'artist=Benthe & Julius', file_path]
+
+# Function to write grids (any iterable, e.g. a generator that steps a simulation) to a
+# video. Frames are rendered by `workers` processes (0 renders in this process) and
+# written to ffmpeg in order. Returns the number of frames written.
+def write_video(grids, file_path, shape, fps=30, bitrate=1800, scale=4, workers=None, codec='libx264', ffmpeg='ffmpeg'):
+    process = subprocess.Popen(ffmpeg_command(file_path, frame_size(shape, scale), fps, bitrate, codec, ffmpeg),
+                               stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+    tasks = ((np.asarray(grid, dtype=np.uint8), scale) for grid in grids)
+    pool = None if workers == 0 else multiprocessing.Pool(workers)
+    window = 2 * (workers or os.cpu_count() or 1)  # Frames in flight at most
+    frames = 0
+    try:
+        if pool is None:
+            for task in tasks:
+                process.stdin.write(_render(task))
+                frames += 1
+        else:
+            # Keep at most `window` frames in flight and write them in order. The next grid is
+            # only taken (and the simulation only stepped) once the oldest frame is written, so
+            # memory stays bounded when ffmpeg is slower than the simulation and the renderers.
+            pending = collections.deque()
+            for task in tasks:
+                pending.append(pool.apply_async(_render, (task,)))
+                if len(pending) >= window:
+                    process.stdin.write(pending.popleft().get())
+                    frames += 1
+            while pending:
+                process.stdin.write(pending.popleft().get())
+                frames += 1
+    except BrokenPipeError:
+        pass  # ffmpeg stopped early, its error is reported below
+    finally:
+        if pool is not None:
+            pool.terminate()
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        error = process.stderr.read().decode(errors='replace')
+        process.wait()
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed with exit code {process.returncode}: {error.strip()}")
+    return frames
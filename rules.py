@@ -0,0 +1,140 @@
+import random
+
+import numpy as np
+
+from counter_rng import CounterRNG
+from forces import EMPTY, MELANOPHORE, XANTHOPHORE
+
+# Local rules of every script variant, so each script keeps its own semantics:
+#   death_neighborhood: which cells are counted for the death check
+#       'slice' - the clipped 3x3 slice minus the cell at slice index [1, 1] (main.py)
+#       'clip'  - the 8 direct neighbours, nothing outside the grid (Test.py)
+#       'box'   - the clipped 3x3 slice including the cell itself (Test Benthe.py)
+#   death_threshold: a cell dies if it has more than this many cells of the other type
+#       around it, or None if it dies when the other type is the majority (Test.py)
+#   differentiation_border: 'wrap' or 'clip' 8-neighbour counts for empty cells,
+#       or None if the variant has no differentiation
+#   differentiation_probability: chance an empty cell with a majority type nearby differentiates
+RULE_VARIANTS = {
+    'main': {
+        'death_neighborhood': 'slice',
+        'death_threshold': 4,
+        'differentiation_border': 'wrap',
+        'differentiation_probability': 0.05,
+    },
+    'test': {
+        'death_neighborhood': 'clip',
+        'death_threshold': None,
+        'differentiation_border': 'clip',
+        'differentiation_probability': 0.05,
+    },
+    'benthe': {
+        'death_neighborhood': 'box',
+        'death_threshold': 3,
+        'differentiation_border': None,  # The differentiation rule in Test Benthe.py is never reached
+        'differentiation_probability': 0.1,
+    },
+}
+
+# Offsets of the 8 direct neighbours
+NEIGHBOR_OFFSETS = [(i, j) for i in (-1, 0, 1) for j in (-1, 0, 1) if (i, j) != (0, 0)]
+
+# Function to sum a boolean map over the 3x3 neighbourhood of every cell.
+# All functions here work on the last two axes, so a stack of grids (replicas, rows, cols)
+# is handled in one go.
+def _neighborhood_sum(mask, border='wrap', include_center=False):
+    mask = mask.astype(np.int64)
+    total = mask.copy() if include_center else np.zeros_like(mask)
+    if border == 'wrap':
+        # Use roll for wrapping (torus, like count_neighbors in main.py)
+        for i, j in NEIGHBOR_OFFSETS:
+            total += np.roll(mask, (-i, -j), axis=(-2, -1))
+    else:
+        # Pad with zeros so nothing outside the grid is counted
+        padded = np.pad(mask, [(0, 0)] * (mask.ndim - 2) + [(1, 1), (1, 1)])
+        rows, cols = mask.shape[-2:]
+        for i, j in NEIGHBOR_OFFSETS:
+            total += padded[..., 1 + i:1 + i + rows, 1 + j:1 + j + cols]
+    return total
+
+# Function to count the adjacent melanophores and xanthophores of every cell at once
+def neighbor_counts(grid, border='wrap'):
+    melanophores = _neighborhood_sum(grid == MELANOPHORE, border)
+    xanthophores = _neighborhood_sum(grid == XANTHOPHORE, border)
+    return melanophores, xanthophores
+
+# Function to count cells the way the direct_neighbors slice in main.py does: the clipped
+# 3x3 slice minus the cell at slice index [1, 1], which is the cell itself except on the
+# first row and column, where the slice starts at the cell
+def _slice_counts(mask):
+    box = _neighborhood_sum(mask, 'clip', include_center=True)
+    rows = np.arange(mask.shape[-2]) + (np.arange(mask.shape[-2]) == 0)
+    cols = np.arange(mask.shape[-1]) + (np.arange(mask.shape[-1]) == 0)
+    return box - mask[..., rows[:, None], cols[None, :]]
+
+# Function to find all cells that die this step
+def death_mask(grid, variant='main'):
+    rules = RULE_VARIANTS[variant]
+    is_melanophore = grid == MELANOPHORE
+    is_xanthophore = grid == XANTHOPHORE
+
+    if rules['death_neighborhood'] == 'slice':
+        melanophores, xanthophores = _slice_counts(is_melanophore), _slice_counts(is_xanthophore)
+    elif rules['death_neighborhood'] == 'box':
+        melanophores = _neighborhood_sum(is_melanophore, 'clip', include_center=True)
+        xanthophores = _neighborhood_sum(is_xanthophore, 'clip', include_center=True)
+    else:
+        melanophores, xanthophores = neighbor_counts(grid, 'clip')
+
+    return _dies(is_melanophore, is_xanthophore, melanophores, xanthophores, rules)
+
+# Function to apply the death rule of a variant to the counts around each cell
+def _dies(is_melanophore, is_xanthophore, melanophores, xanthophores, rules):
+    if rules['death_threshold'] is None:
+        # Majority of the neighbours is of the other type
+        return (is_melanophore & (xanthophores > melanophores)) | (is_xanthophore & (melanophores > xanthophores))
+    threshold = rules['death_threshold']
+    return (is_melanophore & (xanthophores > threshold)) | (is_xanthophore & (melanophores > threshold))
+
+# Function to get the majority type from the neighbour counts (EMPTY if there is none)
+def _majority(melanophores, xanthophores):
+    return np.where(melanophores > xanthophores, MELANOPHORE, np.where(xanthophores > melanophores, XANTHOPHORE, EMPTY))
+
+# Function to find the type every empty cell would differentiate into: the majority type
+# of its neighbours, or EMPTY if there is no majority (or the variant has no differentiation)
+def differentiation_majority(grid, variant='main'):
+    rules = RULE_VARIANTS[variant]
+    if rules['differentiation_border'] is None:
+        return np.zeros_like(grid)
+
+    melanophores, xanthophores = neighbor_counts(grid, rules['differentiation_border'])
+    majority = _majority(melanophores, xanthophores)
+    majority[grid != EMPTY] = EMPTY
+    return majority
+
+# Function to draw which candidates from differentiation_majority actually differentiate.
+# One draw is taken from random_source per candidate, in raster order, so the draws are
+# the same as in the per-cell loops. If random_source is a counter_rng.CounterRNG, every
+# candidate gets the draw keyed by the step and its cell index instead; first_cell is the
+# flat index of the first cell of majority in the whole grid (for strips of a grid). A
+# stack of grids (replicas, rows, cols) is drawn in one call with a CounterRNG that has
+# one seed per replica.
+def draw_births(majority, variant='main', random_source=random.random, candidates=None, step=None, first_cell=0):
+    births = np.zeros_like(majority)
+    if candidates is None:
+        candidates = np.flatnonzero(majority)  # Flat indices of the candidates, in raster order
+    if isinstance(random_source, CounterRNG) and majority.ndim > 2:
+        replicas, cells = np.divmod(candidates, majority.shape[-2] * majority.shape[-1])
+        draws = random_source.uniform(step, 'differentiation', cells, replicas)
+    elif isinstance(random_source, CounterRNG):
+        draws = random_source.uniform(step, 'differentiation', candidates + first_cell)
+    else:
+        draws = np.array([random_source() for _ in range(candidates.size)])
+    chosen = candidates[draws < RULE_VARIANTS[variant]['differentiation_probability']]
+    births.flat[chosen] = majority.flat[chosen]
+    return births
+
+# Function to find the new cells differentiating on empty positions this step.
+# Returns a grid with the new cell type on those positions and EMPTY everywhere else.
+def differentiation(grid, variant='main', random_source=random.random, step=None):
+    return draw_births(differentiation_majority(grid, variant), variant, random_source, step=step)
@@ -0,0 +1,140 @@
+import argparse
+import itertools
+import multiprocessing
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+import model
+from metrics import dominant_stripe
+
+# Parameter sweep over the Morse strengths: every point sets all repulsion strengths
+# (RMM, RXX, RXM) to R and all attraction strengths (AMM, AXX, AXM) to A, like the
+# R*-A*.mp4 videos. Points run headless in a process pool and the final grid and
+# summary statistics of every point go into one SQLite file, so a restarted sweep
+# skips the points that are already done. With until_steady, steps is the maximum and a
+# run stops early once its stripe metrics are steady (see metrics.py).
+
+GRID_SIZE = (50, 50)  # Grid size per run
+STEPS = 100  # Number of simulation steps per run
+
+# Table with one row per finished point
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    R REAL NOT NULL,
+    A REAL NOT NULL,
+    initial TEXT NOT NULL,
+    seed INTEGER NOT NULL,
+    rows INTEGER NOT NULL,
+    cols INTEGER NOT NULL,
+    steps INTEGER NOT NULL,
+    until_steady INTEGER NOT NULL,
+    steps_run INTEGER NOT NULL,
+    melanophores INTEGER NOT NULL,
+    xanthophores INTEGER NOT NULL,
+    empty INTEGER NOT NULL,
+    wavelength REAL,
+    orientation REAL,
+    seconds REAL NOT NULL,
+    grid BLOB NOT NULL,
+    PRIMARY KEY (R, A, initial, seed, rows, cols, steps, until_steady)
+)
+"""
+
+# Function to make every (R, A, initial condition, seed) combination
+def sweep_points(R_values, A_values, initial_conditions=('stripes',), seeds=(0,)):
+    return list(itertools.product(R_values, A_values, initial_conditions, seeds))
+
+# Function to run one point of the sweep without any plotting
+def run_point(point, grid_size=GRID_SIZE, steps=STEPS, until_steady=False, backend='numpy'):
+    R, A, initial, seed = point
+    start = time.perf_counter()
+    simulation = model.Simulation(grid_size, R, R, R, A, A, A, initial=initial, seed=seed, backend=backend)
+    if until_steady:
+        simulation.run_until_steady(steps)
+    else:
+        simulation.run(steps)
+    grid = simulation.grid
+
+    result = dict(R=R, A=A, initial=initial, seed=seed, rows=grid_size[0], cols=grid_size[1], steps=steps,
+                  until_steady=int(until_steady), steps_run=simulation.step_count)
+    result.update(model.summary_statistics(grid))
+    result['wavelength'], result['orientation'] = dominant_stripe(grid)
+    result['seconds'] = time.perf_counter() - start
+    result['grid'] = grid.astype(np.uint8).tobytes()
+    return result
+
+# Worker entry point for the process pool (arguments packed in one tuple)
+def _run_point(args):
+    return run_point(*args)
+
+# Function to open (or create) the results store
+def open_store(path):
+    connection = sqlite3.connect(path)
+    connection.execute(SCHEMA)
+    connection.commit()
+    return connection
+
+# Function to find the points that are already in the store
+def finished_points(connection, grid_size=GRID_SIZE, steps=STEPS, until_steady=False):
+    rows = connection.execute(
+        "SELECT R, A, initial, seed FROM results WHERE rows = ? AND cols = ? AND steps = ? AND until_steady = ?",
+        (grid_size[0], grid_size[1], steps, int(until_steady)),
+    )
+    return set(rows)
+
+# Function to load the final grid of one point from the store
+def load_grid(connection, R, A, initial, seed, grid_size=GRID_SIZE, steps=STEPS, until_steady=False):
+    row = connection.execute(
+        "SELECT grid FROM results WHERE R = ? AND A = ? AND initial = ? AND seed = ? AND rows = ? AND cols = ? "
+        "AND steps = ? AND until_steady = ?",
+        (R, A, initial, seed, grid_size[0], grid_size[1], steps, int(until_steady)),
+    ).fetchone()
+    if row is None:
+        raise KeyError((R, A, initial, seed))
+    return np.frombuffer(row[0], dtype=np.uint8).reshape(grid_size)
+
+# Function to run all points that are not done yet, spread over a pool of processes.
+# Results are written as soon as each run finishes, so an interrupted sweep loses
+# only the runs that were still going.
+def run_sweep(points, store_path, processes=None, grid_size=GRID_SIZE, steps=STEPS, until_steady=False, backend='numpy'):
+    # Reject points that cannot run before any worker starts
+    if grid_size[0] < model.STRIPES_MIN_ROWS and any(point[2] == 'stripes' for point in points):
+        raise ValueError(f"The stripe layout needs at least {model.STRIPES_MIN_ROWS} rows, the grid has {grid_size[0]}")
+    connection = open_store(store_path)
+    done = finished_points(connection, grid_size, steps, until_steady)
+    todo = [tuple(point) for point in points if tuple(point) not in done]
+    print(f"{len(points) - len(todo)} of {len(points)} points already done, running {len(todo)}")
+
+    if todo:
+        with multiprocessing.Pool(processes) as pool:
+            jobs = [(point, grid_size, steps, until_steady, backend) for point in todo]
+            for number, result in enumerate(pool.imap_unordered(_run_point, jobs), start=1):
+                columns = ', '.join(result)
+                placeholders = ', '.join('?' for _ in result)
+                connection.execute(f"INSERT OR REPLACE INTO results ({columns}) VALUES ({placeholders})", list(result.values()))
+                connection.commit()
+                print(f"[{number}/{len(todo)}] R={result['R']} A={result['A']} {result['initial']} seed={result['seed']} "
+                      f"{result['steps_run']} steps ({result['seconds']:.1f} s)")
+    connection.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run a sweep over the Morse repulsion (R) and attraction (A) strengths.")
+    parser.add_argument('--R', type=float, nargs='+', default=[0.001, 0.05, 0.1], help="Repulsion strengths")
+    parser.add_argument('--A', type=float, nargs='+', default=[0.001, 0.01, 0.05], help="Attraction strengths")
+    parser.add_argument('--initial', nargs='+', default=['stripes'], choices=model.INITIAL_CONDITIONS, help="Initial conditions")
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0], help="Random seeds")
+    parser.add_argument('--size', type=int, nargs=2, default=GRID_SIZE, help="Grid size (rows, columns)")
+    parser.add_argument('--steps', type=int, default=STEPS, help="Number of simulation steps (maximum with --until-steady)")
+    parser.add_argument('--until-steady', action='store_true', help="Stop runs early once the stripe pattern is steady")
+    parser.add_argument('--backend', default='numpy', choices=('numpy', 'numba', 'auto'),
+                        help="Commit backend ('auto' uses Numba if it passes the startup check)")
+    parser.add_argument('--processes', type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument('--store', default='sweep_results.sqlite', help="SQLite file for the results")
+    args = parser.parse_args()
+
+    points = sweep_points(args.R, args.A, args.initial, args.seeds)
+    run_sweep(points, args.store, args.processes, tuple(args.size), args.steps, args.until_steady, args.backend)
@@ -0,0 +1,268 @@
+import functools
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from counter_rng import CounterRNG
+from forces import CELL_TYPES, ForceField
+from model import move_targets
+from moves import commit_batched, move_priority
+from rules import RULE_VARIANTS, death_mask, differentiation_majority, draw_births
+
+# Tiled stepping for very large grids. The grid and all per-step fields live in shared
+# memory and every phase of a step is split over a pool of worker processes:
+#   1. forward row FFTs of the occupancy maps, per strip of rows;
+#   2. column FFTs, the product with the Morse kernel spectra and the inverse column FFTs,
+#      per block of columns (the kernel spectra are copied into shared memory once);
+#   3. inverse row FFTs, giving the force on the cells of every strip;
+#   4. death mask, differentiation majority, move targets and move priorities per strip.
+#      A worker reads one halo row above and below its strip from the neighbouring strips
+#      (wrapped on the torus), which is all the 3x3 local rules need.
+# Phases 1-3 are the same 1D transforms numpy's rfft2/irfft2 do, in the same order, so the
+# forces are bit for bit those of forces.ForceField. Other force engines (engine='sparse')
+# are computed by the coordinator.
+# With counter-based draws (Simulation(draws='counter')) every draw is keyed by its cell,
+# so the workers draw the new cells of their own strips as well; with the default stream
+# draws the coordinator draws them in raster order over all strips, so the random stream
+# is the same as in the single-process path. The commit is left to the coordinator: with
+# a batched move policy (see moves.py) that is only resolving the conflicts between
+# moves, with moves='raster' it is the sequential raster-order commit of backends.py.
+# The result is identical to model.Simulation.step for the same seed.
+# The simulation's profiler is used if it has one; phases 1-3 are timed as 'forces', the
+# per-strip pass as 'death' and the coordinator's draws as 'differentiation'.
+# Simulations with incremental=True are rejected: the strips already evaluate the local
+# rules from scratch every step.
+
+# Shared grid-shaped arrays: name -> dtype
+FIELDS = {
+    'grid': np.int64,
+    'force_x': np.float64,
+    'force_y': np.float64,
+    'dies': np.bool_,
+    'majority': np.int64,
+    'births': np.int64,
+    'target_x': np.int64,
+    'target_y': np.int64,
+    'priority': np.float64,
+}
+
+# Shared arrays as seen by a worker process
+_shared = {}
+_memory = []
+
+# Function to get the shared spectral arrays for a grid shape and FFT length: name -> (shape, dtype).
+# rows_<type> holds the row FFTs of the occupancy of a cell type (rows past the grid stay zero),
+# field_<type>_<axis> the force field on that cell type after the column pass, and
+# kernel_<type>_<other>_<axis> the kernel spectra of forces.ForceField.
+def _spectral_fields(shape, length):
+    spectrum = (length[0], length[1] // 2 + 1)
+    fields = {}
+    for cell_type in CELL_TYPES:
+        fields[f'rows_{cell_type}'] = (spectrum, np.complex128)
+        for axis in (0, 1):
+            fields[f'field_{cell_type}_{axis}'] = ((shape[0], spectrum[1]), np.complex128)
+            for other in CELL_TYPES:
+                fields[f'kernel_{cell_type}_{other}_{axis}'] = (spectrum, np.complex128)
+    return fields
+
+# Function to attach a worker process to the shared arrays (name -> (shared memory name, shape, dtype))
+def _attach(names):
+    for field, (name, shape, dtype) in names.items():
+        memory = shared_memory.SharedMemory(name=name)
+        _memory.append(memory)
+        _shared[field] = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+
+# Function to get rows first_row - 1 to last_row + 1 of the grid, wrapped or clipped at the edges.
+# Returns the window and the index of first_row in it.
+def _window(grid, first_row, last_row, border):
+    if border == 'wrap':
+        rows = np.arange(first_row - 1, last_row + 1) % grid.shape[0]
+        return grid[rows], 1
+    start = max(0, first_row - 1)
+    return grid[start:min(grid.shape[0], last_row + 1)], first_row - start
+
+# Function to do the row FFTs (of length cols_length) of the occupancy maps for the rows of one strip (in a worker)
+def _forward_rows(task):
+    first_row, last_row, cols_length = task
+    strip = _shared['grid'][first_row:last_row]
+    for cell_type in CELL_TYPES:
+        _shared[f'rows_{cell_type}'][first_row:last_row] = np.fft.rfft(strip == cell_type, n=cols_length, axis=1)
+
+# Function to do the column FFTs, kernel products and inverse column FFTs for one block of
+# columns (in a worker), for the cell types present in the grid
+def _columns(task):
+    first_col, last_col, cell_types = task
+    rows = _shared['grid'].shape[0]
+    occupancy = {other: np.fft.fft(_shared[f'rows_{other}'][:, first_col:last_col], axis=0) for other in CELL_TYPES}
+    for cell_type in cell_types:
+        for axis in (0, 1):
+            spectrum = sum(occupancy[other] * _shared[f'kernel_{cell_type}_{other}_{axis}'][:, first_col:last_col]
+                           for other in CELL_TYPES)
+            _shared[f'field_{cell_type}_{axis}'][:, first_col:last_col] = np.fft.ifft(spectrum, axis=0)[:rows]
+
+# Function to do the inverse row FFTs for the rows of one strip (in a worker), giving the
+# force on every cell of the strip (zero on empty positions)
+def _inverse_rows(task):
+    first_row, last_row, cols_length, cell_types = task
+    strip = _shared['grid'][first_row:last_row]
+    for axis, field_name in enumerate(('force_x', 'force_y')):
+        force = np.zeros(strip.shape)
+        for cell_type in cell_types:
+            mask = strip == cell_type
+            field = np.fft.irfft(_shared[f'field_{cell_type}_{axis}'][first_row:last_row], n=cols_length, axis=1)
+            force[mask] = field[:, :strip.shape[1]][mask]
+        _shared[field_name][first_row:last_row] = force
+
+# Function to run the local rules, move targets and move priorities for the rows of one strip (in a worker)
+def _step_strip(task):
+    first_row, last_row, variant, seed, step, moves = task
+    rows = last_row - first_row
+    grid = _shared['grid']
+    rules = RULE_VARIANTS[variant]
+
+    # Death checks never wrap, so the halo is clipped at the top and bottom of the grid
+    window, offset = _window(grid, first_row, last_row, 'clip')
+    _shared['dies'][first_row:last_row] = death_mask(window, variant)[offset:offset + rows]
+
+    border = rules['differentiation_border'] or 'clip'
+    window, offset = _window(grid, first_row, last_row, border)
+    majority = differentiation_majority(window, variant)[offset:offset + rows]
+    _shared['majority'][first_row:last_row] = majority
+    random_source = None if seed is None else CounterRNG(seed)
+    if random_source is not None:
+        # Counter-based draws for the cells of this strip
+        _shared['births'][first_row:last_row] = draw_births(majority, variant, random_source, step=step,
+                                                            first_cell=first_row * grid.shape[1])
+
+    force_x, force_y = _shared['force_x'][first_row:last_row], _shared['force_y'][first_row:last_row]
+    target_x, target_y = move_targets(force_x, force_y, grid.shape, first_row)
+    _shared['target_x'][first_row:last_row] = target_x
+    _shared['target_y'][first_row:last_row] = target_y
+    if moves != 'raster':
+        _shared['priority'][first_row:last_row] = move_priority(moves, force_x, force_y, random_source, step, first_row)
+
+
+# Steps a model.Simulation with its strips spread over a pool of worker processes.
+# Use as a context manager (or call close) so the shared memory is released.
+class TiledSimulation:
+    def __init__(self, simulation, workers=None, strips=None, variant='main'):
+        if simulation.incremental:
+            raise ValueError("TiledSimulation evaluates the local rules per strip, incremental=True is not supported")
+        self.simulation = simulation
+        self.variant = variant
+        workers = workers or os.cpu_count()
+        strips = strips or workers
+        shape = simulation.grid.shape
+
+        # Row range of every strip
+        bounds = np.linspace(0, shape[0], min(strips, shape[0]) + 1).astype(int)
+        self.rows = [(int(first), int(last)) for first, last in zip(bounds[:-1], bounds[1:])]
+
+        fields = {field: (shape, dtype) for field, dtype in FIELDS.items()}
+        self.spectral = isinstance(simulation.force_field, ForceField)  # Forces split over the workers
+        if self.spectral:
+            self.length, kernels = simulation.force_field.spectra(shape)
+            fields.update(_spectral_fields(shape, self.length))
+            # Column range of every block of the row spectra
+            spectrum_cols = self.length[1] // 2 + 1
+            bounds = np.linspace(0, spectrum_cols, min(strips, spectrum_cols) + 1).astype(int)
+            self.columns = [(int(first), int(last)) for first, last in zip(bounds[:-1], bounds[1:])]
+
+        self._memory = {}
+        self.arrays = {}
+        for field, (field_shape, dtype) in fields.items():
+            memory = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(field_shape)) * np.dtype(dtype).itemsize))
+            self._memory[field] = memory
+            self.arrays[field] = np.ndarray(field_shape, dtype=dtype, buffer=memory.buf)
+        self.arrays['grid'][...] = simulation.grid
+        if self.spectral:
+            for cell_type in CELL_TYPES:
+                self.arrays[f'rows_{cell_type}'][...] = 0
+                for other in CELL_TYPES:
+                    for axis in (0, 1):
+                        self.arrays[f'kernel_{cell_type}_{other}_{axis}'][...] = kernels[(cell_type, other)][axis]
+
+        names = {field: (memory.name,) + fields[field] for field, memory in self._memory.items()}
+        self.pool = multiprocessing.Pool(workers, initializer=_attach, initargs=(names,))
+
+    # Function to advance the simulation by one step
+    def step(self):
+        simulation = self.simulation
+        profiler = simulation.profiler
+        grid = self.arrays['grid']
+        step = simulation.step_count + 1
+        if profiler is not None:
+            profiler.start(step)
+
+        # Morse force field: row FFTs per strip, column FFTs per block, inverse row FFTs per strip
+        force_x, force_y = self.arrays['force_x'], self.arrays['force_y']
+        if self.spectral:
+            cell_types = tuple(cell_type for cell_type in CELL_TYPES if np.any(grid == cell_type))
+            cols_length = self.length[1]
+            self.pool.map(_forward_rows, [(first, last, cols_length) for first, last in self.rows])
+            self.pool.map(_columns, [(first, last, cell_types) for first, last in self.columns])
+            self.pool.map(_inverse_rows, [(first, last, cols_length, cell_types) for first, last in self.rows])
+        else:
+            force_x[...], force_y[...] = simulation.force_field(grid)
+        if profiler is not None:
+            profiler.lap('forces')
+
+        # Local rules, move targets and move priorities per strip, in parallel
+        seed = simulation.seed if isinstance(simulation.rng, CounterRNG) else None
+        tasks = [(first, last, self.variant, seed, step, simulation.moves) for first, last in self.rows]
+        self.pool.map(_step_strip, tasks)
+        if profiler is not None:
+            profiler.lap('death')
+
+        # Differentiation draws in raster order (unless the workers drew them)
+        if seed is None:
+            births = draw_births(self.arrays['majority'], self.variant, simulation.rng.random)
+        else:
+            births = self.arrays['births']
+        if profiler is not None:
+            profiler.lap('differentiation')
+
+        # Deaths, moves and new cells, in raster order or batched with the move policy
+        commit = simulation.commit
+        if simulation.moves != 'raster':
+            commit = functools.partial(commit_batched, priority=self.arrays['priority'])
+        dies = self.arrays['dies']
+        arguments = (grid, dies, births, self.arrays['target_x'], self.arrays['target_y'])
+        if profiler is None:
+            new_grid = commit(*arguments)
+        else:
+            counts = np.zeros(2, dtype=np.int64)
+            new_grid = commit(*arguments, counts)
+            profiler.lap('commit')
+            profiler.finish(died=int(np.count_nonzero(dies)), moved=int(counts[0]), blocked=int(counts[1]),
+                            born=int(np.count_nonzero(births)))
+        grid[...] = new_grid
+        simulation.grid = new_grid
+        simulation.step_count += 1
+        return new_grid
+
+    # Function to advance the simulation by n steps
+    def run(self, n, recorder=None):
+        for _ in range(n):
+            self.step()
+            if recorder is not None:
+                recorder.append(self.simulation.grid, self.simulation.step_count)
+        return self.simulation.grid
+
+    # Function to stop the workers and release the shared memory
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        self.arrays = {}
+        for memory in self._memory.values():
+            memory.close()
+            memory.unlink()
+        self._memory = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()